@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import json
+import logging
+import os
+import time
+from types import SimpleNamespace
+
+from src.raw.erosion import Erosion
+from src.raw.hm_generation import island
+
+
+def parse_args():
+    argparser = argparse.ArgumentParser(
+        description="Measure the parallel erosion scaling from 1 to N workers")
+    argparser.add_argument("-p", "--parameters",
+                           help="Custom parameters filename in the root directory",
+                           default="generation_parameters.json")
+    argparser.add_argument("-s", "--size", type=int, default=1000,
+                           help="Width and height of the eroded heightmap")
+    argparser.add_argument("-d", "--droplets", type=int, default=50_000,
+                           help="Amount of droplets")
+    argparser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                           help="Maximum number of workers")
+
+    return argparser.parse_args()
+
+
+def main():
+    # Parse arguments
+    args = parse_args()
+    dirname = os.path.dirname(__file__)
+    with open(os.path.join(dirname, args.parameters)) as file:
+        parameters = json.load(file, object_hook=lambda d: SimpleNamespace(**d))
+    parameters.erosion.droplets = args.droplets
+    parameters.erosion.engine = "parallel"
+
+    # Erode the same heightmap with more and more workers
+    heightmap = island.generate(parameters.heightmap_generation, args.size, args.size, parameters.seed)
+    reference = None
+    workers = 1
+    while workers <= args.workers:
+        parameters.erosion.workers = workers
+        eroded = heightmap.copy()
+        erosion = Erosion(parameters.erosion, eroded, args.size, args.size, parameters.seed)
+        erosion.init_brushes()
+        start = time.perf_counter()
+        erosion.erode()
+        duration = time.perf_counter() - start
+        reference = reference or duration
+        print("{w} worker(s): {d:.2f}s, speedup x{s:.2f}".format(
+            w=workers, d=duration, s=reference / duration))
+        workers *= 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
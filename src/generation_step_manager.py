@@ -18,11 +18,16 @@ class GenerationStepManager():
         step: int
     Id of the step, must be greater or equal to zero
         data_type: type
-    Any type that has a to_array() and clone() method and a from_array(arr) static method"""
+    Any type that has a to_array() and clone() method and a from_array(arr) static method
+        version: object
+    Optional, layout of the steps saved with them (any picklable value), a steps file saved with another
+    version is ignored. Change it when the steps are renumbered, so the old files don't load the data of
+    a step into another one"""
 
-    def __init__(self, enabled: bool, path: str, step: int, data_type: type):
+    def __init__(self, enabled: bool, path: str, step: int, data_type: type, version: object = None):
         self._enabled = enabled
         self._path = path
+        self._version = version
         self._data_type = data_type
         self._data = None
         self._step = step
@@ -60,7 +65,11 @@ class GenerationStepManager():
             try:
                 # Loading the steps
                 with open(self._path, 'rb') as file:
-                    self._steps = pickle.load(file)
+                    saved = pickle.load(file)
+                if not isinstance(saved, dict) or 'steps' not in saved or saved.get('version') != self._version:
+                    raise ValueError("The steps were saved by another version of the steps: {v}".format(
+                        v=saved.get('version') if isinstance(saved, dict) else None))
+                self._steps = saved['steps']
             except Exception as e:
                 logging.warning("Fail to load '{p}'. Initializing with the parameters.\n{err}".format(
                     p=self._path, err=e))
@@ -86,7 +95,7 @@ class GenerationStepManager():
         # Create the new file
         try:
             with open(self._path, 'wb') as file:
-                pickle.dump(self._steps, file)
+                pickle.dump({'version': self._version, 'steps': self._steps}, file)
         except Exception as e:
             logging.warning(
                 "Fail to save steps in '{p}': {err}".format(p=self._path, err=e))
@@ -17,15 +17,59 @@ def resize_data(data: numpy.array, data_width: int, data_height: int, factor: in
         numpy.array, int, int
     The new array and its dimensions"""
 
+    # Materialize the upscaled view with a single copy
+    new_data = upscale_view(data[:data_width, :data_height], factor).reshape(
+        data_width * factor, data_height * factor)
+
+    # Results
+    return new_data, data_width * factor, data_height * factor
+
+
+def upscale_view(data: numpy.array, factor: int) -> numpy.array:
+    """Nearest neighbour upscaling of a 2D array without copy. The cell [x, y] of the upscaled array is the
+    cell [x, i, y, j] of the view with x = x // factor * factor + i and y = y // factor * factor + j.
+    The view is read only, reshape it to (width * factor, height * factor) to materialize it
+    Parameters
+    ==========
+        data: numpy.array
+    An numpy 2d array
+        factor: int
+    Size factor between new data and the older one
+    Returns
+    =======
+        numpy.array
+    A read only 4d view of shape (width, factor, height, factor)"""
+
+    width, height = data.shape
+    return numpy.broadcast_to(data[:, numpy.newaxis, :, numpy.newaxis], (width, factor, height, factor))
+
+
+def reduce_data(data: numpy.array, data_width: int, data_height: int, factor: int) -> [numpy.array, int, int]:
+    """Reduce a 2D array to a smaller 2D array, each new cell is the mean of a block of factor x factor cells.
+    The last rows and columns that don't fill a whole block are ignored
+    Parameters
+    ==========
+        data: numpy.array
+    An numpy array
+        data_width: int
+    Dimension of the array
+        data_height: int
+    Dimension of the array
+        factor: int
+    Size factor between the older data and the new one
+    Returns
+    =======
+        numpy.array, int, int
+    The new array and its dimensions"""
+
     # Init
-    new_data_width = data_width * factor
-    new_data_height = data_height * factor
-    new_data = numpy.zeros((new_data_width, new_data_height))
-
-    # Create the new data set
-    for x in range(new_data_width):
-        for y in range(new_data_height):
-            new_data[x, y] = data[int(x / factor), int(y / factor)]
-    
+    new_data_width = data_width // factor
+    new_data_height = data_height // factor
+
+    # Average the blocks
+    blocks = data[:new_data_width * factor, :new_data_height * factor].reshape(
+        new_data_width, factor, new_data_height, factor)
+    new_data = blocks.mean(axis=(1, 3))
+
     # Results
-    return new_data, new_data_width, new_data_height
\ No newline at end of file
+    return new_data, new_data_width, new_data_height
@@ -0,0 +1,27 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+
+def shifted_slices(dir_x: int, dir_y: int, width: int, height: int) -> tuple:
+    """Create the slices of the cells that have a neighbour in the given direction, and of these neighbours
+    Parameters
+    ==========
+        dir_x: int
+    Direction offset on the x axis
+        dir_y: int
+    Direction offset on the y axis
+        width: int
+    Width of the 2d array
+        height: int
+    Height of the 2d array
+    Returns
+    =======
+        tuple (cells, neighbours)
+    The (x slice, y slice) tuples, array[neighbours] are the neighbours of array[cells] in the direction"""
+
+    def axis(offset, size):
+        return slice(max(0, -offset), size - max(0, offset)), slice(max(0, offset), size + min(0, offset))
+
+    cells_x, neighbours_x = axis(dir_x, width)
+    cells_y, neighbours_y = axis(dir_y, height)
+    return (cells_x, cells_y), (neighbours_x, neighbours_y)
@@ -0,0 +1,18 @@
+def split_tiles(width: int, height: int, tile_size: int) -> list:
+    """Split a 2D array into square tiles
+    Parameters
+    ==========
+        width: int
+    Dimension of the array
+        height: int
+    Dimension of the array
+        tile_size: int
+    Maximum width and height of a tile, the tiles on the borders can be smaller
+    Returns
+    =======
+        list [(x_start, x_end, y_start, y_end)]
+    The bounds of each tile, ends excluded"""
+
+    return [(x, min(x + tile_size, width), y, min(y + tile_size, height))
+            for x in range(0, width, tile_size)
+            for y in range(0, height, tile_size)]
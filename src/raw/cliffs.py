@@ -5,6 +5,7 @@ import logging
 
 import numpy
 from src.helpers.chrono import chrono
+from src.helpers.shift import shifted_slices
 
 
 class Cliffs():
@@ -14,7 +15,7 @@ class Cliffs():
         parameters: object
     A SimpleNamespace object with attributes (sea Parameters.parameters)
         stratums: object
-    Numpy 2D array that contains height data
+    Numpy 2D array that contains the stratums levels
         width: int
     Width of the map
         height: int
@@ -52,6 +53,43 @@ class Cliffs():
         
         return Cliffs.CLIFF_TO_DIR_VECTOR.get(value, None)
 
+    @staticmethod
+    def upscale_cliffs(cliffs: object, width: int, height: int, factor: int) -> object:
+        """Calculate the cliff codes of the stratums resized by a factor, from the cliffs codes of the stratums.
+        In the resized stratums, a neighbour of a cell is either in the same block of factor x factor cells,
+        so on the same stratum, or in the block of a neighbour of the original cell. So the code of a cell
+        only depends on the original code and on the position of the cell in its block: it's read from a
+        lookup table per position.
+        Parameters
+        ==========
+            cliffs: object
+        numpy 2d array of the cliff codes of the stratums
+            width: int
+        Width of the cliffs
+            height: int
+        Height of the cliffs
+            factor: int
+        Size factor of the resize
+        Returns
+        =======
+            numpy 2d array
+        The cliff codes of the resized stratums, identical to calculate_cliffs on them"""
+
+        bits = len(Cliffs.DIRS_OFFSETS)
+        codes = numpy.arange(1 << bits)
+        upscaled = numpy.zeros((width * factor, height * factor), numpy.uint8)
+        for block_x in range(factor):
+            for block_y in range(factor):
+                # Lookup table of the position in the block
+                table = numpy.zeros(1 << bits, numpy.uint8)
+                for i, (dir_x, dir_y) in enumerate(Cliffs.DIRS_OFFSETS):
+                    original_dir = ((block_x + dir_x) // factor, (block_y + dir_y) // factor)
+                    if original_dir != (0, 0):
+                        j = Cliffs.DIRS_OFFSETS.index(original_dir)
+                        table |= (((codes >> (bits - 1 - j)) & 1) << (bits - 1 - i)).astype(numpy.uint8)
+                upscaled[block_x::factor, block_y::factor] = table[cliffs]
+        return upscaled
+
     def __init__(self, parameters: object, stratums: object, width: int, height: int):
         self._parameters = parameters
         self._stratums = stratums
@@ -65,29 +103,22 @@ class Cliffs():
 
     @chrono
     def calculate_cliffs(self):
-        """Process through the stratums and calculate the cliff code"""
+        """Process through the stratums and calculate the cliff code.
+        The bit 7 - i of the code is set if the neighbour in the direction DIRS_OFFSETS[i] is on a lower
+        stratum, the neighbours outside of the map are never lower"""
 
-        self._cliffs = cliffs = numpy.zeros((self._width, self._height), numpy.int64)
+        self._cliffs = cliffs = numpy.zeros((self._width, self._height), numpy.uint8)
         if (numpy.amax(self._stratums) == numpy.amin(self._stratums)):
             return  # Flatland
         # Wrok variables
-        dirs_offsets = self.DIRS_OFFSETS
-        map_width = self._width
-        map_height = self._height
         stratums = self._stratums
+        lower = numpy.empty((self._width, self._height), bool)
+        bits = len(self.DIRS_OFFSETS)
         # Calculate each cliff orientation
-        for x in range(map_width):
-            for y in range(map_height):
-                current_height = stratums[x, y]
-                current = 0
-                for dir_x, dir_y in dirs_offsets:
-                    nx, ny = x + dir_x, y + dir_y
-                    current = current << 1
-                    if 0 <= nx < map_width and 0 <= ny < map_height:
-                        gradient = stratums[nx, ny] - current_height
-                        if gradient < 0:
-                            current |= 1
-                # if current == 0:
-                #     current = 0x100
-                cliffs[x, y] = current
+        for i, (dir_x, dir_y) in enumerate(self.DIRS_OFFSETS):
+            cells, neighbours = shifted_slices(dir_x, dir_y, self._width, self._height)
+            lower.fill(False)
+            # Compared, not subtracted: the levels are unsigned
+            numpy.less(stratums[neighbours], stratums[cells], out=lower[cells])
+            cliffs |= lower.view(numpy.uint8) << (bits - 1 - i)
         self._cliffs = cliffs
@@ -1,12 +1,19 @@
 #! /usr/bin/env python3
 # coding: utf-8
 
+import concurrent.futures
+import hashlib
 import logging
 import math
+import os
+import pickle
 import random
+import time
+from multiprocessing import shared_memory
 
 import numpy
 from src.helpers.chrono import chrono
+from src.raw.erosion_statistics import ErosionStatistics
 
 
 class Erosion():
@@ -23,6 +30,10 @@ class Erosion():
     Height of the 2D array
         seed: int
     Used to create the PRNG
+        checkpoint_path: str
+    Optional, path of the checkpoint file. If given, the partial heightmap and the PRNG state are saved
+    every checkpoint_interval droplets, and an interrupted erosion resumes from the last checkpoint with the
+    same result as an uninterrupted one. The file is removed once the erosion is over
     Parameters.parameters
     =====================
         droplets: int
@@ -51,16 +62,49 @@ class Erosion():
     Inital movement speed of a droplet
         sea_level: float
     When a droplet reach this height, it dies
+        engine: str
+    Optional, "sequential" (default) simulates the droplets one at a time, "batched" advances batch_size
+    droplets together as numpy arrays. The droplets of a batch see the heightmap of the previous step, the
+    erosion of the droplets that share a cell in a step is scaled down to its height
+        batch_size: int
+    Optional, number of droplets simulated together by the batched engine (default 4096). The parallel
+    engine runs this amount of droplets per round
+        workers: int
+    Optional, number of processes of the "parallel" engine, 0 (default) for one per CPU
+        spawn: str
+    Optional, where the droplets spawn: "uniform" (default) on the whole map, "land" only on the cells above
+    sea_level, "height" on the cells above sea_level, weighted by their height above it
+        checkpoint_interval: int
+    Optional, minimum number of droplets between two checkpoints (default 50000). The checkpoints are taken
+    between two batches of batch_size droplets
+        adaptive: bool
+    Optional, if True (default False) the erosion stops before the droplets amount once it converged: when the
+    mean absolute height change per droplet of a batch drops below convergence_threshold, or when the
+    time_budget is spent. droplets is then the hard cap
+        convergence_threshold: float
+    Optional, mean absolute height change per droplet under which the adaptive erosion stops (default 0.01)
+        time_budget: float
+    Optional, wall-clock seconds after which the adaptive erosion stops, 0 (default) for no limit
+        statistics: bool
+    Optional, if True (default False) the erosion module writes the statistics in the output folder
+        statistics_maps: bool
+    Optional, if True (default False) the statistics also collect the erosion and deposition heat maps
     Raises
     ======
         AttributeError
     If a parameter is missing."""
 
-    def __init__(self, parameters: object, heightmap: object, width: int, height: int, seed: int):
+    # Attributes created by init_brushes
+    BRUSHES_ATTRIBUTES = ('_brushes_x_class', '_brushes_y_class', '_brushes_y_classes', '_brushes_starts',
+                          '_brushes_ox', '_brushes_oy', '_brushes_we')
+
+    def __init__(self, parameters: object, heightmap: object, width: int, height: int, seed: int,
+                 checkpoint_path: str = None):
         try:
             self._heightmap = heightmap
             self._width = width
             self._height = height
+            self._seed = seed
             self._prng = random.Random(seed)
             self._droplets_amount = parameters.droplets
             self._brush_radius = parameters.brush_radius
@@ -75,61 +119,110 @@ class Erosion():
             self._initial_water = parameters.initial_water_volume
             self._initial_speed = parameters.initial_speed
             self._sea_level = parameters.sea_level
+            self._engine = getattr(parameters, 'engine', 'sequential')
+            self._batch_size = getattr(parameters, 'batch_size', 4096)
+            self._workers = getattr(parameters, 'workers', 0)
+            self._spawn = getattr(parameters, 'spawn', 'uniform')
+            self._checkpoint_path = checkpoint_path
+            self._checkpoint_interval = getattr(parameters, 'checkpoint_interval', 50_000)
+            self._adaptive = getattr(parameters, 'adaptive', False)
+            self._convergence_threshold = getattr(parameters, 'convergence_threshold', 0.01)
+            self._time_budget = getattr(parameters, 'time_budget', 0)
+            self._droplets_used = 0
+            self._statistics_maps = getattr(parameters, 'statistics_maps', False)
+            self._statistics = None
+            self._parameters = parameters
         except AttributeError as e:
             logging.critical(
                 "A required parameter is missing from the parameters : \n{err}".format(err=e))
         
     @chrono
     def init_brushes(self):
-        """Initialize the erosion brushes. This long method is optimized to minimize the call to function"""
+        """Initialize the erosion brushes.
+        The brush of a cell is the brush template clipped on the map borders. Cells that are clipped the same
+        way share a brush variant, so only a few variants exist: the interior one and the border ones.
+        The variants are stored as compressed sparse rows: the points of the variant v are the indices
+        brushes_starts[v] to brushes_starts[v + 1] of brushes_ox, brushes_oy and brushes_we.
+        The variant of the cell (x, y) is brushes_x_class[x] * brushes_y_classes + brushes_y_class[y]."""
 
         # Initialize work variables
-        radius = self._brush_radius
         width = self._width
         height = self._height
-        weight_sum = 0
-        add_index = 0
-        brush_template = self._brush_template(radius)
-        offsets_x = numpy.zeros(len(brush_template))
-        offsets_y = numpy.zeros(len(brush_template))
-        weights = numpy.zeros(len(brush_template))
-        # Final brushes data
-        brushes_ox = numpy.full((width, height), object)
-        brushes_oy = numpy.full((width, height), object)
-        brushes_we = numpy.full((width, height), object)
-
-        # Create the brush for each cell
-        for x in range(width):
-            for y in range(height):
-                # The brush change if the cell is near the borders
-                if (y <= radius or y >= height - radius or x <= radius + 1 or x >= width - radius):
-                    weight_sum = 0
-                    add_index = 0
-                    for ox, oy, weight in brush_template:
-                        coord_x = x + ox
-                        coord_y = y + oy
-                        if coord_x >= 0 and coord_x < width and coord_y >= 0 and coord_y < height:
-                            offsets_x[add_index] = ox
-                            offsets_y[add_index] = oy
-                            weights[add_index] = weight
-                            weight_sum += weight
-                            add_index += 1
-                # Set the brush
-                # Note that add_index and all the variables only changes when the brush
-                # is near a border
-                num_entries = add_index
-                brushes_ox[x, y] = [None] * num_entries
-                brushes_oy[x, y] = [None] * num_entries
-                brushes_we[x, y] = [None] * num_entries
-                for i in range(num_entries):
-                    brushes_ox[x, y][i] = int(x + offsets_x[i])
-                    brushes_oy[x, y][i] = int(y + offsets_y[i])
-                    brushes_we[x, y][i] = weights[i] / weight_sum
+        brush_template = self._brush_template(self._brush_radius)
+        template_x = numpy.array([ox for ox, _oy, _w in brush_template], numpy.int32)
+        template_y = numpy.array([oy for _ox, oy, _w in brush_template], numpy.int32)
+
+        # Classify the columns and the rows by the amount of brush clipped on each border
+        x_class, x_representatives = self._brush_classes(template_x, width)
+        y_class, y_representatives = self._brush_classes(template_y, height)
+
+        # Create each variant from a representative cell
+        starts = [0]
+        brushes_ox, brushes_oy, brushes_we = [], [], []
+        for x in x_representatives:
+            for y in y_representatives:
+                weight_sum = 0
+                points = []
+                for ox, oy, weight in brush_template:
+                    if 0 <= x + ox < width and 0 <= y + oy < height:
+                        points.append((ox, oy, weight))
+                        weight_sum += weight
+                for ox, oy, weight in points:
+                    brushes_ox.append(ox)
+                    brushes_oy.append(oy)
+                    brushes_we.append(weight / weight_sum)
+                starts.append(len(brushes_ox))
 
         # Save brushes in the erosion object
-        self._brushes_ox = brushes_ox
-        self._brushes_oy = brushes_oy
-        self._brushes_we = brushes_we
+        self._brushes_x_class = x_class
+        self._brushes_y_class = y_class
+        self._brushes_y_classes = len(y_representatives)
+        self._brushes_starts = numpy.array(starts, numpy.int32)
+        self._brushes_ox = numpy.array(brushes_ox, numpy.int32)
+        self._brushes_oy = numpy.array(brushes_oy, numpy.int32)
+        self._brushes_we = numpy.array(brushes_we, numpy.float64)
+
+    def _brush_classes(self, offsets: object, size: int) -> tuple:
+        """Classify the coordinates of an axis by the way the brush is clipped on the borders
+        Parameters
+        ==========
+            offsets: object
+        numpy array of the brush template offsets along the axis
+            size: int
+        Size of the map along the axis
+        Returns
+        =======
+            tuple (classes, representatives)
+        The class of each coordinate (numpy array) and one coordinate of each class"""
+
+        coords = numpy.arange(size)
+        clipped_low = numpy.maximum(0, -numpy.amin(offsets) - coords)
+        clipped_high = numpy.maximum(0, coords + numpy.amax(offsets) - (size - 1))
+        _keys, representatives, classes = numpy.unique(
+            clipped_low * (size + 1) + clipped_high, return_index=True, return_inverse=True)
+        return classes.astype(numpy.int32), representatives.tolist()
+
+    def _brush_variant(self, cell_x: object, cell_y: object) -> object:
+        """Retrieve the brush variant of the given cells (int or numpy arrays)"""
+        return self._brushes_x_class[cell_x] * self._brushes_y_classes + self._brushes_y_class[cell_y]
+
+    def _padded_brushes(self) -> tuple:
+        """Convert the brush variants into padded 2d arrays, one row per variant
+        Returns
+        =======
+            tuple (offsets_x, offsets_y, weights, valid)
+        The numpy 2d arrays, valid is False for the padding"""
+
+        starts = self._brushes_starts
+        lengths = numpy.diff(starts)
+        valid = numpy.arange(numpy.amax(lengths))[None, :] < lengths[:, None]
+        offsets_x = numpy.zeros(valid.shape, numpy.int64)
+        offsets_y = numpy.zeros(valid.shape, numpy.int64)
+        weights = numpy.zeros(valid.shape, numpy.float64)
+        offsets_x[valid] = self._brushes_ox
+        offsets_y[valid] = self._brushes_oy
+        weights[valid] = self._brushes_we
+        return offsets_x, offsets_y, weights, valid
 
     def _brush_template(self, radius: int) -> tuple:
         """Create the template for the circular brush
@@ -156,10 +249,262 @@ class Erosion():
                         (x, y, 1 - math_sqrt(sqr_dst) / radius))
         return tuple(brush_template)
 
+    def _init_spawn(self):
+        """Initialize the cells where the droplets spawn, once per run.
+        The spawn cells are the flat indices x * (height - 1) + y of the cells above the sea, the last row and
+        column excluded like the uniform spawn. With the "height" spawn, spawn_cdf is the cumulative sum of
+        their heights above the sea, the droplets are drawn from it."""
+
+        self._spawn_cells = None
+        self._spawn_cdf = None
+        if self._spawn == 'uniform':
+            return
+        if self._spawn not in ('land', 'height'):
+            raise ValueError(
+                "Unknown droplets spawn '{s}'".format(s=self._spawn))
+
+        # Only keep the cells above the sea
+        heights = self._heightmap[:self._width - 1, :self._height - 1]
+        land = heights > self._sea_level if self._sea_level is not None else numpy.ones(heights.shape, bool)
+        cells = numpy.flatnonzero(land)
+        if len(cells) == 0:
+            logging.warning("No land above the sea level, the droplets spawn on the whole map.")
+            return
+        self._spawn_cells = cells
+        if self._spawn == 'height':
+            weights = heights[land] - (self._sea_level if self._sea_level is not None else numpy.amin(heights))
+            cdf = numpy.cumsum(weights)
+            # Flat land, no weighting
+            if cdf[-1] > 0:
+                self._spawn_cdf = cdf
+        logging.debug("Droplets spawn on {c} of {n} cells".format(
+            c=len(cells), n=heights.size))
+
+    def _spawn_positions(self, prng: object, count: int) -> tuple:
+        """Draw the initial cell of the droplets
+        Parameters
+        ==========
+            prng: object
+        numpy random generator
+            count: int
+        Number of droplets
+        Returns
+        =======
+            tuple (pos_x, pos_y)
+        numpy arrays of the cells coordinates"""
+
+        if self._spawn_cells is None:
+            return prng.integers(0, self._width - 1, count), prng.integers(0, self._height - 1, count)
+        if self._spawn_cdf is None:
+            cells = self._spawn_cells[prng.integers(0, len(self._spawn_cells), count)]
+        else:
+            draws = prng.random(count) * self._spawn_cdf[-1]
+            cells = self._spawn_cells[numpy.searchsorted(self._spawn_cdf, draws, side='right')]
+        return numpy.divmod(cells, self._height - 1)
+
+    @property
+    def droplets_used(self):
+        """Access the number of droplets simulated by the last erosion"""
+        return self._droplets_used
+
+    @property
+    def statistics(self):
+        """Access the ErosionStatistics of the last erosion"""
+        return self._statistics
+
     @chrono
     def erode(self):
         """Simulate a large amount of water droplets progressivly eroding the heightmap."""
 
+        self._init_spawn()
+        self._init_checkpoints()
+        self._droplets_used = self._droplets_amount
+        self._statistics = ErosionStatistics(self._width, self._height, self._statistics_maps)
+        self._adaptive_start = time.perf_counter()
+        if self._engine == 'batched':
+            self._erode_batched()
+        elif self._engine == 'sequential':
+            self._erode_sequential()
+        elif self._engine == 'parallel':
+            self._erode_parallel()
+        else:
+            raise ValueError(
+                "Unknown erosion engine '{e}'".format(e=self._engine))
+        self._statistics.duration = time.perf_counter() - self._adaptive_start
+        self._statistics.log()
+        # The erosion is over, the checkpoint is useless
+        if self._checkpoint_path and os.path.exists(self._checkpoint_path):
+            os.remove(self._checkpoint_path)
+        if self._adaptive:
+            logging.info("Adaptive erosion used {d} of {n} droplets".format(
+                d=self._droplets_used, n=self._droplets_amount))
+
+    def _init_adaptive(self, heightmap: object = None):
+        """Keep the heightmap before the first batch of the adaptive erosion
+        Parameters
+        ==========
+            heightmap: object
+        The eroded heightmap, self._heightmap by default"""
+
+        if self._adaptive:
+            self._adaptive_reference = (self._heightmap if heightmap is None else heightmap).copy()
+
+    def _converged(self, droplets: int, count: int, heightmap: object = None) -> bool:
+        """Check if the adaptive erosion must stop after a batch
+        Parameters
+        ==========
+            droplets: int
+        Number of droplets simulated since the beginning of the erosion
+            count: int
+        Number of droplets of the batch
+            heightmap: object
+        The eroded heightmap, self._heightmap by default
+        Returns
+        =======
+            bool
+        True if the erosion converged or if its time budget is spent"""
+
+        if not self._adaptive or droplets >= self._droplets_amount:
+            return False
+        heightmap = self._heightmap if heightmap is None else heightmap
+        reference = self._adaptive_reference
+        # Mean absolute height change per droplet of the batch
+        numpy.subtract(heightmap, reference, out=reference)
+        change = numpy.sum(numpy.abs(reference, out=reference)) / count
+        reference[:] = heightmap
+        elapsed = time.perf_counter() - self._adaptive_start
+        logging.debug("Batch change per droplet: {c}".format(c=change))
+        if change < self._convergence_threshold or (self._time_budget and elapsed >= self._time_budget):
+            self._droplets_used = droplets
+            return True
+        return False
+
+    def _init_checkpoints(self):
+        """Identify the erosion run, a checkpoint is only resumed by the same run: same parameters, seed and
+        initial heightmap"""
+
+        self._last_checkpoint = 0
+        self._checkpoint_key = None
+        if not self._checkpoint_path:
+            return
+        parameters = sorted((key, repr(value)) for key, value in vars(self._parameters).items())
+        self._checkpoint_key = hashlib.sha1(repr((parameters, self._seed, self._heightmap.shape)).encode())
+        self._checkpoint_key.update(numpy.ascontiguousarray(self._heightmap).tobytes())
+        self._checkpoint_key = self._checkpoint_key.hexdigest()
+
+    def _load_checkpoint(self, prng: object, heightmap: object = None) -> int:
+        """Resume the erosion from the checkpoint file, if it belongs to this run
+        Parameters
+        ==========
+            prng: object
+        The random.Random or numpy random generator used to spawn the droplets, its state is restored
+            heightmap: object
+        The heightmap to restore, the eroded one by default
+        Returns
+        =======
+            int
+        Number of droplets already simulated"""
+
+        if not self._checkpoint_path or not os.path.exists(self._checkpoint_path):
+            return 0
+        try:
+            with open(self._checkpoint_path, 'rb') as file:
+                checkpoint = pickle.load(file)
+        except Exception as e:
+            logging.warning("Fail to load the erosion checkpoint '{p}'.\n{err}".format(
+                p=self._checkpoint_path, err=e))
+            return 0
+        if checkpoint['key'] != self._checkpoint_key:
+            logging.warning("The erosion checkpoint '{p}' belongs to another generation, it's ignored.".format(
+                p=self._checkpoint_path))
+            return 0
+
+        # Restore the heightmap and the PRNG
+        (self._heightmap if heightmap is None else heightmap)[:] = checkpoint['heightmap']
+        if isinstance(prng, random.Random):
+            prng.setstate(checkpoint['prng'])
+        else:
+            prng.bit_generator.state = checkpoint['prng']
+        self._last_checkpoint = checkpoint['droplets']
+        logging.info("Erosion resumed from the checkpoint, {d} of {n} droplets already simulated".format(
+            d=checkpoint['droplets'], n=self._droplets_amount))
+        return checkpoint['droplets']
+
+    def _save_checkpoint(self, droplets: int, prng: object, heightmap: object = None):
+        """Save the checkpoint file if checkpoint_interval droplets were simulated since the last one
+        Parameters
+        ==========
+            droplets: int
+        Number of droplets already simulated
+            prng: object
+        The random.Random or numpy random generator used to spawn the droplets
+            heightmap: object
+        The heightmap to save, the eroded one by default"""
+
+        if not self._checkpoint_path or droplets >= self._droplets_amount or \
+                droplets - self._last_checkpoint < self._checkpoint_interval:
+            return
+        checkpoint = {
+            'key': self._checkpoint_key,
+            'droplets': droplets,
+            'prng': prng.getstate() if isinstance(prng, random.Random) else prng.bit_generator.state,
+            'heightmap': (self._heightmap if heightmap is None else heightmap).copy()
+        }
+        # Replace the previous checkpoint only once the new one is complete
+        try:
+            with open(self._checkpoint_path + ".tmp", 'wb') as file:
+                pickle.dump(checkpoint, file)
+            os.replace(self._checkpoint_path + ".tmp", self._checkpoint_path)
+            self._last_checkpoint = droplets
+        except Exception as e:
+            logging.warning("Fail to save the erosion checkpoint '{p}': {err}".format(
+                p=self._checkpoint_path, err=e))
+
+    def _erode_sequential(self):
+        """Simulate the droplets one at a time, spawned by batches of batch_size droplets"""
+
+        width = self._width
+        height = self._height
+        if self._spawn_cells is None:
+            prng = self._prng
+        else:
+            prng = numpy.random.default_rng(self._prng.getrandbits(64))
+        first = self._load_checkpoint(prng)
+        self._init_adaptive()
+
+        for first_droplet in range(first, self._droplets_amount, self._batch_size):
+            count = min(self._batch_size, self._droplets_amount - first_droplet)
+            logging.debug("{d} of {n} ({p}%)".format(
+                d=first_droplet, n=self._droplets_amount,
+                p=round(10000 * first_droplet / self._droplets_amount) / 100))
+            if self._spawn_cells is None:
+                rand_pos = prng.randint
+                positions = [(rand_pos(0, width - 2), rand_pos(0, height - 2))
+                             for _droplet in range(count)]
+            else:
+                pos_x, pos_y = self._spawn_positions(prng, count)
+                positions = zip(pos_x.tolist(), pos_y.tolist())
+            self._simulate_droplets(positions, count, log=False, statistics=self._statistics)
+            self._save_checkpoint(first_droplet + count, prng)
+            if self._converged(first_droplet + count, count):
+                break
+        # Last droplet debug
+        logging.debug("{d} of {n} ({p}%)".format(
+            d=self._droplets_amount, n=self._droplets_amount, p=100.00))
+
+    def _simulate_droplets(self, positions: object, amount: int, log: bool = True, statistics: object = None):
+        """Simulate the given droplets one at a time
+        Parameters
+        ==========
+            positions: iterable
+        Initial (x, y) position of each droplet
+            amount: int
+        Number of droplets
+            log: bool
+        Log the progress if True
+            statistics: ErosionStatistics
+        Optional, the statistics where the counters of the droplets are added"""
+
         # Note: this method can't afford to call functions, this is why it's soooo long : optimization
 
         # Initialize work variables
@@ -175,35 +520,42 @@ class Erosion():
         sediment_min_capacity = self._sediment_min_capacity
         deposit_speed = self._deposit_speed
         erode_speed = self._erode_speed
-        brushes_ox = self._brushes_ox
-        brushes_oy = self._brushes_oy
-        brushes_we = self._brushes_we
+        brushes_x_class = self._brushes_x_class.tolist()
+        brushes_y_class = self._brushes_y_class.tolist()
+        brushes_y_classes = self._brushes_y_classes
+        brushes_starts = self._brushes_starts.tolist()
+        brushes_ox = self._brushes_ox.tolist()
+        brushes_oy = self._brushes_oy.tolist()
+        brushes_we = self._brushes_we.tolist()
         gravity = self._gravity
         evaporate_factor = 1 - self._evaporate_speed
         log_step = 5_000
         next_log = log_step
+        # Statistics counters
+        steps = sea = edge = stalled = exhausted = 0
+        eroded = deposited = 0.0
+        erosion_map = statistics.erosion_map if statistics else None
+        deposition_map = statistics.deposition_map if statistics else None
+        heat_maps = erosion_map is not None
         # Optimization
-        rand_pos = self._prng.randint
         height_and_gradient = self._calculate_height_and_gradient
         math_sqrt = math.sqrt
 
-        for droplet in range(self._droplets_amount):
+        for droplet, (pos_x, pos_y) in enumerate(positions):
             # Log progress
-            if droplet == next_log:
+            if log and droplet == next_log:
                 next_log += log_step
                 logging.debug("{d} of {n} ({p}%)".format(
-                    d=droplet, n=self._droplets_amount, 
-                    p=round(10000 * droplet/self._droplets_amount) / 100))
+                    d=droplet, n=amount,
+                    p=round(10000 * droplet / amount) / 100))
             # Initialize droplet
-            pos_x = rand_pos(0, width - 2)
-            pos_y = rand_pos(0, height - 2)
             dir_x = 0
             dir_y = 0
             speed = initial_speed
             water = initial_water
             sediment = 0
             # Simulate the droplet
-            for _a_day_as_a_droplet in range(droplet_max_lifetime):
+            for a_day_as_a_droplet in range(droplet_max_lifetime):
                 # > Move the droplet
                 cell_x = int(pos_x)
                 cell_y = int(pos_y)
@@ -224,7 +576,11 @@ class Erosion():
                 pos_x += dir_x
                 pos_y += dir_y
                 # Stop simulating droplet if it's not moving or has flowed over edge of map
-                if ((dir_x == 0 and dir_y == 0) or pos_x < 1 or pos_x >= width - 2 or pos_y < 1 or pos_y >= height - 2):
+                if (dir_x == 0 and dir_y == 0):
+                    stalled += 1
+                    break
+                if (pos_x < 1 or pos_x >= width - 2 or pos_y < 1 or pos_y >= height - 2):
+                    edge += 1
                     break
                 # Find the droplet's new height and calculate the deltaHeight
                 new_droplet_height = height_and_gradient(
@@ -232,6 +588,7 @@ class Erosion():
                 delta_height = new_droplet_height - droplet_height
                 # Stop simulating droplet if it's fallen into the sea
                 if (sea_level != None and new_droplet_height <= sea_level):
+                    sea += 1
                     break
                 # > Erode the heightmap
                 # Calculate the droplet's sediment capacity (higher when moving fast down a slope and contains lots of water)
@@ -247,6 +604,7 @@ class Erosion():
                         amount_to_deposit = (
                             sediment - sediment_capacity) * deposit_speed
                     sediment -= amount_to_deposit
+                    deposited += amount_to_deposit
                     # Add the sediment to the four nodes of the current cell using bilinear interpolation
                     #  Deposition is not distributed over a radius (like erosion) so that it can fill small pits
                     heightmap[cell_x, cell_y] += amount_to_deposit * \
@@ -257,6 +615,15 @@ class Erosion():
                         (1 - cell_offset_x) * cell_offset_y
                     heightmap[cell_x + 1, cell_y + 1] += amount_to_deposit * \
                         cell_offset_x * cell_offset_y
+                    if heat_maps:
+                        deposition_map[cell_x, cell_y] += amount_to_deposit * \
+                            (1 - cell_offset_x) * (1 - cell_offset_y)
+                        deposition_map[cell_x + 1, cell_y] += amount_to_deposit * \
+                            cell_offset_x * (1 - cell_offset_y)
+                        deposition_map[cell_x, cell_y + 1] += amount_to_deposit * \
+                            (1 - cell_offset_x) * cell_offset_y
+                        deposition_map[cell_x + 1, cell_y + 1] += amount_to_deposit * \
+                            cell_offset_x * cell_offset_y
 
                 else:
                     # Erode a fraction of the droplet's current carry capacity.
@@ -265,22 +632,316 @@ class Erosion():
                         (sediment_capacity - sediment) * erode_speed, -delta_height)
 
                     # Use erosion brush to erode from all nodes inside the droplet's erosion radius
-                    for brush_point_index in range(len(brushes_ox[cell_x, cell_y])):
-                        ox = brushes_ox[cell_x, cell_y][brush_point_index]
-                        oy = brushes_oy[cell_x, cell_y][brush_point_index]
-                        delta_sediment = min(heightmap[ox, oy], amount_to_erode *
-                                             brushes_we[cell_x, cell_y][brush_point_index])
-                        heightmap[ox, oy] -= delta_sediment
-                        sediment += delta_sediment
+                    sediment_before = sediment
+                    variant = brushes_x_class[cell_x] * brushes_y_classes + brushes_y_class[cell_y]
+                    if not heat_maps:
+                        for brush_point_index in range(brushes_starts[variant], brushes_starts[variant + 1]):
+                            ox = cell_x + brushes_ox[brush_point_index]
+                            oy = cell_y + brushes_oy[brush_point_index]
+                            delta_sediment = min(heightmap[ox, oy], amount_to_erode *
+                                                 brushes_we[brush_point_index])
+                            heightmap[ox, oy] -= delta_sediment
+                            sediment += delta_sediment
+                    else:
+                        # Same loop with the heat map, kept apart to not slow down the erosion without it
+                        for brush_point_index in range(brushes_starts[variant], brushes_starts[variant + 1]):
+                            ox = cell_x + brushes_ox[brush_point_index]
+                            oy = cell_y + brushes_oy[brush_point_index]
+                            delta_sediment = min(heightmap[ox, oy], amount_to_erode *
+                                                 brushes_we[brush_point_index])
+                            heightmap[ox, oy] -= delta_sediment
+                            sediment += delta_sediment
+                            erosion_map[ox, oy] += delta_sediment
+                    eroded += sediment - sediment_before
                 # Update droplet's speed and water content
                 speed = math_sqrt(
                     max(0, speed * speed + delta_height * gravity))
                 water *= evaporate_factor
+            else:
+                exhausted += 1
+                a_day_as_a_droplet = droplet_max_lifetime
+            steps += a_day_as_a_droplet
+        # Save the statistics
+        if statistics:
+            statistics.steps += steps
+            statistics.terminations['sea'] += sea
+            statistics.terminations['edge'] += edge
+            statistics.terminations['stalled'] += stalled
+            statistics.terminations['lifetime'] += exhausted
+            statistics.eroded += eroded
+            statistics.deposited += deposited
+        # Last droplet debug
+        if log:
+            logging.debug("{d} of {n} ({p}%)".format(
+                d=amount, n=amount, p=100.00))
+
+    def _erode_parallel(self):
+        """Simulate the droplets in worker processes sharing the heightmap.
+        The map is split into vertical strips and each droplet belongs to the strip where it spawns.
+        A droplet can't affect the cells further than a halo of droplet_lifetime + brush extent + 2 cells
+        from its spawn. The strips are at least two halos wide, so the even strips can be eroded at the same
+        time without touching the same cells, then the odd strips. Each strip is simulated sequentially:
+        for a given seed and number of workers, the result doesn't depend on the process scheduling.
+        The heightmap and the heat maps are in a shared memory, the workers receive the brushes once when
+        they start, the strip tasks only carry the droplets positions."""
+
+        # Initialize work variables
+        workers = self._workers or os.cpu_count()
+        prng = numpy.random.default_rng(self._prng.getrandbits(64))
+        bounds = self._strip_bounds(workers)
+        strips_amount = len(bounds) - 1
+        maps = self._statistics.erosion_map is not None
+
+        # Put the heightmap, and the heat maps, in the shared memory
+        layers_shape = (3 if maps else 1,) + self._heightmap.shape
+        memory = shared_memory.SharedMemory(create=True, size=self._heightmap.nbytes * layers_shape[0])
+        try:
+            layers = numpy.ndarray(layers_shape, self._heightmap.dtype, buffer=memory.buf)
+            layers.fill(0)
+            heightmap = layers[0]
+            heightmap[:] = self._heightmap
+            brushes = {name: getattr(self, name) for name in self.BRUSHES_ATTRIBUTES}
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers, initializer=_init_strip_worker,
+                    initargs=(self._parameters, memory.name, layers_shape, heightmap.dtype.str, brushes)) as executor:
+                first = self._load_checkpoint(prng, heightmap)
+                self._init_adaptive(heightmap)
+                for first_droplet in range(first, self._droplets_amount, self._batch_size):
+                    count = min(self._batch_size, self._droplets_amount - first_droplet)
+                    logging.debug("{d} of {n} ({p}%)".format(
+                        d=first_droplet, n=self._droplets_amount,
+                        p=round(10000 * first_droplet / self._droplets_amount) / 100))
+                    # Spawn the droplets of the round and sort them by strip
+                    pos_x, pos_y = self._spawn_positions(prng, count)
+                    strips = numpy.searchsorted(bounds, pos_x, side='right') - 1
+                    # Even strips then odd strips
+                    for parity in (0, 1):
+                        futures = []
+                        for strip in range(parity, strips_amount, 2):
+                            in_strip = strips == strip
+                            futures.append(executor.submit(
+                                _erode_strip, pos_x[in_strip].tolist(), pos_y[in_strip].tolist()))
+                        for future in futures:
+                            self._statistics.merge(future.result())
+                    self._save_checkpoint(first_droplet + count, prng, heightmap)
+                    if self._converged(first_droplet + count, count, heightmap):
+                        break
+            # Retrieve the result
+            self._heightmap[:] = heightmap
+            if maps:
+                self._statistics.erosion_map += layers[1]
+                self._statistics.deposition_map += layers[2]
+            del heightmap, layers
+        finally:
+            memory.close()
+            memory.unlink()
         # Last droplet debug
         logging.debug("{d} of {n} ({p}%)".format(
-            d=self._droplets_amount, n=self._droplets_amount, 
+            d=self._droplets_amount, n=self._droplets_amount, p=100.00))
+
+    def _strip_bounds(self, workers: int) -> object:
+        """Split the map into the vertical strips of the parallel erosion
+        Parameters
+        ==========
+            workers: int
+        Number of worker processes
+        Returns
+        =======
+            numpy array
+        The first column of each strip and the map width, the strip s is bounds[s] <= x < bounds[s + 1]"""
+
+        extent = max(max(abs(ox), abs(oy)) for ox, oy, _w in self._brush_template(self._brush_radius))
+        halo = self._droplet_lifetime + extent + 2
+        strips_amount = max(1, min(2 * workers, self._width // (2 * halo)))
+        logging.debug("Parallel erosion on {s} strips, halo of {h} cells".format(s=strips_amount, h=halo))
+        return numpy.linspace(0, self._width, strips_amount + 1).astype(numpy.int64)
+
+    def _erode_batched(self):
+        """Simulate the droplets by batches, all the droplets of a batch advance together as numpy arrays.
+        The heightmap is updated with scatter-adds at the end of each step of the batch."""
+
+        # Initialize work variables
+        heightmap = self._heightmap
+        width = self._width
+        height = self._height
+        inertia = self._inertia
+        sea_level = self._sea_level
+        sediment_capacity_factor = self._sediment_capacity_factor
+        sediment_min_capacity = self._sediment_min_capacity
+        deposit_speed = self._deposit_speed
+        erode_speed = self._erode_speed
+        gravity = self._gravity
+        evaporate_factor = 1 - self._evaporate_speed
+        prng = numpy.random.default_rng(self._prng.getrandbits(64))
+        # Brush variants as padded arrays
+        brushes_ox, brushes_oy, brushes_we, brushes_valid = self._padded_brushes()
+        add_at = numpy.add.at
+        where = numpy.where
+        statistics = self._statistics
+        terminations = statistics.terminations
+        heat_maps = statistics.erosion_map is not None
+
+        first = self._load_checkpoint(prng)
+        self._init_adaptive()
+
+        for first_droplet in range(first, self._droplets_amount, self._batch_size):
+            batch_count = count = min(self._batch_size, self._droplets_amount - first_droplet)
+            logging.debug("{d} of {n} ({p}%)".format(
+                d=first_droplet, n=self._droplets_amount,
+                p=round(10000 * first_droplet / self._droplets_amount) / 100))
+            # Initialize droplets
+            pos_x, pos_y = self._spawn_positions(prng, count)
+            pos_x = pos_x.astype(numpy.float64)
+            pos_y = pos_y.astype(numpy.float64)
+            dir_x = numpy.zeros(count)
+            dir_y = numpy.zeros(count)
+            speed = numpy.full(count, float(self._initial_speed))
+            water = numpy.full(count, float(self._initial_water))
+            sediment = numpy.zeros(count)
+
+            # Simulate the droplets
+            for _a_day_as_a_droplet in range(self._droplet_lifetime):
+                # > Move the droplets
+                cell_x = pos_x.astype(numpy.int64)
+                cell_y = pos_y.astype(numpy.int64)
+                cell_offset_x = pos_x - cell_x
+                cell_offset_y = pos_y - cell_y
+                droplet_height, gradient_x, gradient_y = self._calculate_heights_and_gradients(
+                    heightmap, pos_x, pos_y)
+                # Update the droplets direction and position (move position 1 unit regardless of speed)
+                dir_x = dir_x * inertia - gradient_x * (1 - inertia)
+                dir_y = dir_y * inertia - gradient_y * (1 - inertia)
+                length = numpy.sqrt(dir_x * dir_x + dir_y * dir_y)
+                moving = length != 0
+                length[~moving] = 1
+                dir_x /= length
+                dir_y /= length
+                pos_x = pos_x + dir_x
+                pos_y = pos_y + dir_y
+                # Stop simulating droplets that aren't moving or have flowed over edge of map
+                alive = moving & (pos_x >= 1) & (pos_x < width - 2) & (
+                    pos_y >= 1) & (pos_y < height - 2)
+                alive_index = numpy.nonzero(alive)[0]
+                moving_count = numpy.count_nonzero(moving)
+                terminations['stalled'] += count - moving_count
+                terminations['edge'] += moving_count - len(alive_index)
+                new_droplet_height = numpy.full(count, -numpy.inf)
+                new_droplet_height[alive_index] = self._calculate_heights_and_gradients(
+                    heightmap, pos_x[alive_index], pos_y[alive_index])[0]
+                delta_height = new_droplet_height - droplet_height
+                # Stop simulating droplets that have fallen into the sea
+                if sea_level is not None:
+                    alive &= new_droplet_height > sea_level
+                    terminations['sea'] += len(alive_index) - numpy.count_nonzero(alive)
+                if not alive.any():
+                    break
+
+                # > Keep only the alive droplets
+                pos_x, pos_y = pos_x[alive], pos_y[alive]
+                dir_x, dir_y = dir_x[alive], dir_y[alive]
+                speed, water, sediment = speed[alive], water[alive], sediment[alive]
+                cell_x, cell_y = cell_x[alive], cell_y[alive]
+                cell_offset_x, cell_offset_y = cell_offset_x[alive], cell_offset_y[alive]
+                delta_height = delta_height[alive]
+                count = len(pos_x)
+                statistics.steps += count
+
+                # > Erode the heightmap
+                # Calculate the droplets sediment capacity
+                sediment_capacity = numpy.maximum(-delta_height * speed * water *
+                                                  sediment_capacity_factor, sediment_min_capacity)
+                depositing = (sediment > sediment_capacity) | (delta_height > 0)
+                # Deposit: fill up to the current height when moving uphill, else a fraction of the excess
+                amount_to_deposit = where(delta_height > 0, numpy.minimum(delta_height, sediment),
+                                          (sediment - sediment_capacity) * deposit_speed)
+                amount_to_deposit[~depositing] = 0
+                sediment -= amount_to_deposit
+                deposit = numpy.nonzero(depositing)[0]
+                dx, dy = cell_x[deposit], cell_y[deposit]
+                ox, oy = cell_offset_x[deposit], cell_offset_y[deposit]
+                amount = amount_to_deposit[deposit]
+                add_at(heightmap, (dx, dy), amount * (1 - ox) * (1 - oy))
+                add_at(heightmap, (dx + 1, dy), amount * ox * (1 - oy))
+                add_at(heightmap, (dx, dy + 1), amount * (1 - ox) * oy)
+                add_at(heightmap, (dx + 1, dy + 1), amount * ox * oy)
+                statistics.deposited += numpy.sum(amount)
+                if heat_maps:
+                    add_at(statistics.deposition_map, (dx, dy), amount * (1 - ox) * (1 - oy))
+                    add_at(statistics.deposition_map, (dx + 1, dy), amount * ox * (1 - oy))
+                    add_at(statistics.deposition_map, (dx, dy + 1), amount * (1 - ox) * oy)
+                    add_at(statistics.deposition_map, (dx + 1, dy + 1), amount * ox * oy)
+                # Erode: a fraction of the carry capacity, clamped to the change in height, with the brush
+                erode = numpy.nonzero(~depositing)[0]
+                amount_to_erode = numpy.minimum(
+                    (sediment_capacity[erode] - sediment[erode]) * erode_speed, -delta_height[erode])
+                variant = self._brush_variant(cell_x[erode], cell_y[erode])
+                inside = brushes_valid[variant]
+                brush_weights = brushes_we[variant]
+                brush_x = (cell_x[erode, None] + brushes_ox[variant])[inside]
+                brush_y = (cell_y[erode, None] + brushes_oy[variant])[inside]
+                # The droplets of a cell share its height : their total erosion is capped by it
+                requested = (amount_to_erode[:, None] * brush_weights)[inside]
+                shares = numpy.unique(brush_x * height + brush_y, return_inverse=True)[1]
+                total = numpy.bincount(shares, requested)[shares]
+                current = heightmap[brush_x, brush_y]
+                available = numpy.maximum(current, 0)
+                capped = total > available
+                requested[capped] *= available[capped] / total[capped]
+                delta_sediment = numpy.zeros(inside.shape)
+                delta_sediment[inside] = requested
+                add_at(heightmap, (brush_x, brush_y), -delta_sediment[inside])
+                # The capped cells are emptied exactly, without the rounding errors of the sum of the shares
+                heightmap[brush_x[capped], brush_y[capped]] = current[capped] - available[capped]
+                sediment[erode] += delta_sediment.sum(axis=1)
+                statistics.eroded += numpy.sum(delta_sediment)
+                if heat_maps:
+                    add_at(statistics.erosion_map, (brush_x, brush_y), delta_sediment[inside])
+
+                # Update droplets speed and water content
+                speed = numpy.sqrt(numpy.maximum(
+                    0, speed * speed + delta_height * gravity))
+                water *= evaporate_factor
+            else:
+                terminations['lifetime'] += count
+            self._save_checkpoint(first_droplet + batch_count, prng)
+            if self._converged(first_droplet + batch_count, batch_count):
+                break
+        # Last droplet debug
+        logging.debug("{d} of {n} ({p}%)".format(
+            d=self._droplets_amount, n=self._droplets_amount,
             p=100.00))
 
+    def _calculate_heights_and_gradients(self, heightmap: object, pos_x: object, pos_y: object) -> tuple:
+        """Calculate the heights and the gradients of the given points, vectorized version of
+        _calculate_height_and_gradient
+        Parameters
+        ==========
+            heightmap: object
+        numpy 2D array containing floats
+            pos_x: object
+        numpy array of the x positions where to calculate the height and gradient
+            pos_y: object
+        numpy array of the y positions where to calculate the height and gradient
+        Returns
+        =======
+            tuple (heights, gradients_x, gradients_y)"""
+
+        cell_x = pos_x.astype(numpy.int64)
+        cell_y = pos_y.astype(numpy.int64)
+        x = pos_x - cell_x
+        y = pos_y - cell_y
+        height_nw = heightmap[cell_x, cell_y]
+        height_ne = heightmap[cell_x + 1, cell_y]
+        height_sw = heightmap[cell_x, cell_y + 1]
+        height_se = heightmap[cell_x + 1, cell_y + 1]
+        gradient_x = (height_ne - height_nw) * (1 - y) + \
+            (height_se - height_sw) * y
+        gradient_y = (height_sw - height_nw) * (1 - x) + \
+            (height_se - height_ne) * x
+        heights = height_nw * (1 - x) * (1 - y) + height_ne * x * \
+            (1 - y) + height_sw * (1 - x) * y + height_se * x * y
+        return (heights, gradient_x, gradient_y)
+
     def _calculate_height_and_gradient(self, heightmap: object, width: int, height: int, pos_x: float, pos_y: float) -> tuple:
         """Calculate the height and the gradients of the given point
         Parameters
@@ -318,3 +979,53 @@ class Erosion():
         height = height_nw * (1 - x) * (1 - y) + height_ne * x * \
             (1 - y) + height_sw * (1 - x) * y + height_se * x * y
         return (height, gradient_x, gradient_y)
+
+
+_strip_worker = None  # Shared memory, erosion and heat maps of a parallel erosion worker
+
+
+def _init_strip_worker(parameters: object, memory_name: str, shape: tuple, dtype: str, brushes: dict):
+    """Prepare a parallel erosion worker: attach the shared memory and create the erosion of the strips
+    Parameters
+    ==========
+        parameters: object
+    The erosion parameters
+        memory_name: str
+    Name of the shared memory that contains the heightmap, then the erosion and deposition maps if any
+        shape: tuple
+    Shape of the shared layers (layers, width, height)
+        dtype: str
+    Type of the layers values
+        brushes: dict
+    The brushes attributes of the Erosion that runs the parallel erosion"""
+
+    global _strip_worker
+    memory = shared_memory.SharedMemory(name=memory_name)
+    layers = numpy.ndarray(shape, dtype, buffer=memory.buf)
+    erosion = Erosion(parameters, layers[0], shape[1], shape[2], 0)
+    for name, value in brushes.items():
+        setattr(erosion, name, value)
+    # The memory is kept open as long as the worker lives
+    _strip_worker = (memory, erosion, layers[1:] if shape[0] == 3 else None)
+
+
+def _erode_strip(pos_x: list, pos_y: list) -> ErosionStatistics:
+    """Simulate droplets on the shared heightmap, used by the parallel erosion workers
+    Parameters
+    ==========
+        pos_x: list
+    Initial x position of each droplet
+        pos_y: list
+    Initial y position of each droplet
+    Returns
+    =======
+        ErosionStatistics
+    The counters of the droplets, the heat maps are written in the shared memory"""
+
+    _memory, erosion, maps = _strip_worker
+    statistics = ErosionStatistics(0, 0)
+    if maps is not None:
+        statistics.erosion_map, statistics.deposition_map = maps
+    erosion._simulate_droplets(zip(pos_x, pos_y), len(pos_x), log=False, statistics=statistics)
+    statistics.erosion_map = statistics.deposition_map = None
+    return statistics
@@ -0,0 +1,121 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import json
+import logging
+import os
+
+import numpy
+import src.exporters.png as exporter_png
+
+
+class ErosionStatistics():
+    """Counters of an erosion run
+    Parameters
+    ==========
+        width: int
+    Width of the eroded heightmap
+        height: int
+    Height of the eroded heightmap
+        maps: bool
+    True to collect the erosion and deposition heat maps
+    Attributes
+    ==========
+        duration: float
+    Wall-clock seconds of the erosion
+        steps: int
+    Total number of steps simulated by the droplets
+        terminations: dict
+    Number of droplets by termination reason: fallen in the 'sea', flowed over the 'edge' of the map,
+    'stalled' on a flat area or reached its 'lifetime'
+        eroded: float
+    Total mass removed from the heightmap
+        deposited: float
+    Total mass added to the heightmap
+        erosion_map: object
+    numpy 2d array of the mass removed from each cell, None without the maps
+        deposition_map: object
+    numpy 2d array of the mass added to each cell, None without the maps"""
+
+    TERMINATIONS = ('sea', 'edge', 'stalled', 'lifetime')
+
+    def __init__(self, width: int, height: int, maps: bool = False):
+        self.duration = 0.0
+        self.steps = 0
+        self.terminations = dict.fromkeys(self.TERMINATIONS, 0)
+        self.eroded = 0.0
+        self.deposited = 0.0
+        self.erosion_map = numpy.zeros((width, height)) if maps else None
+        self.deposition_map = numpy.zeros((width, height)) if maps else None
+
+    @property
+    def droplets(self) -> int:
+        """Number of droplets simulated"""
+        return sum(self.terminations.values())
+
+    @property
+    def droplets_per_second(self) -> float:
+        """Number of droplets simulated per second"""
+        return self.droplets / self.duration if self.duration else 0.0
+
+    @property
+    def mean_lifetime(self) -> float:
+        """Mean number of steps simulated per droplet"""
+        return self.steps / self.droplets if self.droplets else 0.0
+
+    def merge(self, other: object):
+        """Add the counters of another statistics object, the durations aren't added
+        Parameters
+        ==========
+            other: ErosionStatistics
+        The statistics to add"""
+
+        self.steps += other.steps
+        for reason in self.TERMINATIONS:
+            self.terminations[reason] += other.terminations[reason]
+        self.eroded += other.eroded
+        self.deposited += other.deposited
+        if self.erosion_map is not None and other.erosion_map is not None:
+            self.erosion_map += other.erosion_map
+            self.deposition_map += other.deposition_map
+
+    def to_dict(self) -> dict:
+        """Convert the counters into a dict, the heat maps excluded
+        Returns
+        =======
+            dict"""
+
+        return {
+            'droplets': self.droplets,
+            'duration': self.duration,
+            'droplets_per_second': self.droplets_per_second,
+            'mean_lifetime': self.mean_lifetime,
+            'terminations': dict(self.terminations),
+            'eroded': self.eroded,
+            'deposited': self.deposited
+        }
+
+    def log(self):
+        """Log a summary of the counters"""
+
+        logging.info("Erosion: {d} droplets, {s:.0f} droplets/s, mean lifetime {l:.1f}, terminations {t}, "
+                     "eroded {e:.4f}, deposited {p:.4f}".format(
+                         d=self.droplets, s=self.droplets_per_second, l=self.mean_lifetime,
+                         t=self.terminations, e=self.eroded, p=self.deposited))
+
+    def save(self, directory: str):
+        """Write the counters in 'erosion_statistics.json' and the heat maps in 'erosion_map.png' and
+        'deposition_map.png'
+        Parameters
+        ==========
+            directory: str
+        Path to the output folder"""
+
+        with open(os.path.join(directory, "erosion_statistics.json"), 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+        if self.erosion_map is not None:
+            width, height = self.erosion_map.shape
+            exporter_png.export(os.path.join(directory, "erosion_map.png"),
+                                width, height, self.erosion_map)
+            exporter_png.export(os.path.join(directory, "deposition_map.png"),
+                                width, height, self.deposition_map)
@@ -0,0 +1,123 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import logging
+from types import SimpleNamespace
+
+import numpy
+from src.helpers.chrono import chrono
+from src.helpers.resize import reduce_data, resize_data
+from src.raw.erosion import Erosion
+
+
+def erode(parameters: object, heightmap: object, width: int, height: int, seed: int,
+          checkpoint_path: str = None, path_to_outputs: str = None) -> object:
+    """Erode the heightmap with water droplets, see src.raw.erosion.Erosion for the parameters
+    Parameters
+    ==========
+        parameters: object
+    A SimpleNamespace object with the erosion parameters
+        heightmap: object
+    The 2d numpy array to erode, it is modified in place
+        width: int
+    Width of the 2D array
+        height: int
+    Height of the 2D array
+        seed: int
+    The randomness seed
+        checkpoint_path: str
+    Optional, path of the checkpoint file used to resume an interrupted erosion
+        path_to_outputs: str
+    Optional, the output folder where the erosion statistics are written if the statistics parameter is True
+    Parameters.parameters
+    =====================
+    The Erosion parameters and
+        coarse_factor: int
+    Optional, if greater than 1 (default 1) a heightmap reduced by this factor is eroded first, its
+    change is upscaled and applied to the heightmap before the full resolution erosion
+        coarse_droplets: int
+    Optional, amount of droplets of the coarse erosion (default droplets)
+    Returns
+    =======
+        numpy 2d array
+    The eroded heightmap"""
+
+    # Coarse erosion, it shapes the large valleys for a fraction of the droplets
+    coarse_factor = getattr(parameters, 'coarse_factor', 1)
+    if coarse_factor > 1:
+        coarse_checkpoint_path = checkpoint_path + ".coarse" if checkpoint_path else None
+        _erode_coarse(parameters, heightmap, width, height, seed + 1, coarse_factor, coarse_checkpoint_path)
+
+    # Full resolution erosion
+    erosion = Erosion(parameters, heightmap, width, height, seed, checkpoint_path)
+    erosion.init_brushes()
+    erosion.erode()
+    if path_to_outputs and getattr(parameters, 'statistics', False):
+        erosion.statistics.save(path_to_outputs)
+    return heightmap
+
+
+@chrono
+def _erode_coarse(parameters: object, heightmap: object, width: int, height: int, seed: int, factor: int,
+                  checkpoint_path: str):
+    """Erode a reduced copy of the heightmap and apply its change to the heightmap.
+    The brush radius and the droplets lifetime are scaled down with the map, the change is upscaled with
+    resize_data then smoothed with a box blur of the factor size to avoid the steps between the blocks
+    Parameters
+    ==========
+        parameters, heightmap, width, height, seed, checkpoint_path
+    Same as erode
+        factor: int
+    Size factor between the heightmap and the coarse one"""
+
+    # Reduce the heightmap
+    coarse, coarse_width, coarse_height = reduce_data(heightmap, width, height, factor)
+    if coarse_width < 4 or coarse_height < 4:
+        logging.warning("The coarse erosion is skipped, the map is too small for the factor {f}".format(
+            f=factor))
+        return
+    original = coarse.copy()
+
+    # Scale the parameters
+    coarse_parameters = SimpleNamespace(**vars(parameters))
+    coarse_parameters.droplets = getattr(parameters, 'coarse_droplets', parameters.droplets)
+    coarse_parameters.brush_radius = max(1, round(parameters.brush_radius / factor))
+    coarse_parameters.droplet_lifetime = max(1, parameters.droplet_lifetime // factor)
+    coarse_parameters.statistics_maps = False
+
+    # Erode the coarse heightmap
+    erosion = Erosion(coarse_parameters, coarse, coarse_width, coarse_height, seed, checkpoint_path)
+    erosion.init_brushes()
+    erosion.erode()
+
+    # Upscale its change and apply it
+    delta, delta_width, delta_height = resize_data(coarse - original, coarse_width, coarse_height, factor)
+    delta = numpy.pad(delta, ((0, width - delta_width), (0, height - delta_height)), mode='edge')
+    heightmap += _box_blur(delta, factor)
+
+
+def _box_blur(data: object, size: int) -> object:
+    """Blur a 2d array with a box of size x size cells, the borders are extended
+    Parameters
+    ==========
+        data: object
+    numpy 2d array
+        size: int
+    Width of the box
+    Returns
+    =======
+        numpy 2d array
+    The blurred array"""
+
+    before = size // 2
+    after = size - 1 - before
+    for axis in (0, 1):
+        padding = [(0, 0), (0, 0)]
+        padding[axis] = (before + 1, after)
+        sums = numpy.cumsum(numpy.pad(data, padding, mode='edge'), axis=axis)
+        length = data.shape[axis]
+        if axis == 0:
+            data = (sums[size:size + length] - sums[:length]) / size
+        else:
+            data = (sums[:, size:size + length] - sums[:, :length]) / size
+    return data
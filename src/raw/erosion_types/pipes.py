@@ -0,0 +1,199 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import logging
+
+import numpy
+from src.helpers.chrono import chrono
+
+
+@chrono
+def erode(parameters: object, heightmap: object, width: int, height: int, seed: int,
+          checkpoint_path: str = None, path_to_outputs: str = None) -> object:
+    """Erode the heightmap with a grid based hydraulic erosion (virtual pipe model).
+    Each iteration works on whole arrays: rain, water flux through virtual pipes between the 4 neighbours,
+    water height and velocity, sediment erosion or deposition, sediment transport and evaporation.
+    Its cost is O(iterations x cells).
+    Parameters
+    ==========
+        parameters: object
+    A SimpleNamespace object with attributes (sea Parameters.parameters)
+        heightmap: object
+    The 2d numpy array to erode, it is modified in place
+        width: int
+    Width of the 2D array
+        height: int
+    Height of the 2D array
+        seed: int
+    Used to create the PRNG of the rain
+        checkpoint_path: str
+    Unused, this erosion isn't resumable
+        path_to_outputs: str
+    Unused, this erosion has no statistics
+    Parameters.parameters
+    =====================
+        iterations: int
+    Amount of simulation steps
+        time_step: float
+    Duration of a simulation step
+        rain_rate: float
+    Maximum amount of water added to a cell per time unit
+        gravity: float
+    Gravity use in the flux calculation
+        sediment_capacity_factor: float
+    Mult of the sediment capacity of the water
+        min_tilt: float
+    Minimum terrain tilt used in the capacity calculation, it keeps the flat areas erodable
+        erode_speed: float
+    Factor of erosion
+        deposit_speed: float
+    Factor of deposition
+        evaporate_speed: float
+    Speed of water evaporation
+        sea_level: float
+    Water and sediment reaching this height are lost in the sea, the lands are not eroded below it
+    Returns
+    =======
+        numpy 2d array
+    The eroded heightmap"""
+
+    # Retrieve parameters
+    try:
+        iterations = parameters.iterations
+        time_step = parameters.time_step
+        rain_rate = parameters.rain_rate
+        gravity = parameters.gravity
+        sediment_capacity_factor = parameters.sediment_capacity_factor
+        min_tilt = parameters.min_tilt
+        erode_speed = parameters.erode_speed
+        deposit_speed = parameters.deposit_speed
+        evaporate_speed = parameters.evaporate_speed
+        sea_level = parameters.sea_level
+    except AttributeError as e:
+        logging.critical(
+            "A required parameter is missing from the parameters : \n{err}".format(err=e))
+
+    # Initialize working variables
+    prng = numpy.random.default_rng(seed)
+    terrain = heightmap
+    shape = (width, height)
+    water = numpy.zeros(shape)
+    sediment = numpy.zeros(shape)
+    # Outflow flux to the left (x - 1), right (x + 1), top (y - 1) and bottom (y + 1) neighbours
+    flux_left = numpy.zeros(shape)
+    flux_right = numpy.zeros(shape)
+    flux_top = numpy.zeros(shape)
+    flux_bottom = numpy.zeros(shape)
+    inflow = numpy.zeros(shape)
+    cells_x, cells_y = numpy.indices(shape, numpy.float64)
+    log_step = max(1, iterations // 10)
+
+    for iteration in range(iterations):
+        # Log progress
+        if iteration % log_step == 0:
+            logging.debug("{i} of {n} ({p}%)".format(
+                i=iteration, n=iterations, p=round(10000 * iteration / iterations) / 100))
+        sea = terrain <= sea_level
+
+        # > Rain on the lands
+        water += time_step * rain_rate * prng.random(shape) * ~sea
+
+        # > Outflow flux, proportional to the difference of water surface, none through the map borders
+        surface = terrain + water
+        flux_left[1:, :] = numpy.maximum(
+            0, flux_left[1:, :] + time_step * gravity * (surface[1:, :] - surface[:-1, :]))
+        flux_right[:-1, :] = numpy.maximum(
+            0, flux_right[:-1, :] + time_step * gravity * (surface[:-1, :] - surface[1:, :]))
+        flux_top[:, 1:] = numpy.maximum(
+            0, flux_top[:, 1:] + time_step * gravity * (surface[:, 1:] - surface[:, :-1]))
+        flux_bottom[:, :-1] = numpy.maximum(
+            0, flux_bottom[:, :-1] + time_step * gravity * (surface[:, :-1] - surface[:, 1:]))
+        # A cell can't give more water than it has
+        outflow = flux_left + flux_right + flux_top + flux_bottom
+        scaling = numpy.ones(shape)
+        flowing = outflow > 0
+        scaling[flowing] = numpy.minimum(
+            1, water[flowing] / (outflow[flowing] * time_step))
+        flux_left *= scaling
+        flux_right *= scaling
+        flux_top *= scaling
+        flux_bottom *= scaling
+        outflow *= scaling
+
+        # > Water height update
+        inflow.fill(0)
+        inflow[:-1, :] += flux_left[1:, :]
+        inflow[1:, :] += flux_right[:-1, :]
+        inflow[:, :-1] += flux_top[:, 1:]
+        inflow[:, 1:] += flux_bottom[:, :-1]
+        previous_water = water
+        water = numpy.maximum(0, water + time_step * (inflow - outflow))
+        mean_water = (previous_water + water) / 2
+
+        # > Velocity field, from the water passing through each cell
+        through_x = flux_right - flux_left
+        through_x[1:, :] += flux_right[:-1, :]
+        through_x[:-1, :] -= flux_left[1:, :]
+        through_y = flux_bottom - flux_top
+        through_y[:, 1:] += flux_bottom[:, :-1]
+        through_y[:, :-1] -= flux_top[:, 1:]
+        wet = mean_water > 1e-9
+        velocity_x = numpy.zeros(shape)
+        velocity_y = numpy.zeros(shape)
+        velocity_x[wet] = through_x[wet] / (2 * mean_water[wet])
+        velocity_y[wet] = through_y[wet] / (2 * mean_water[wet])
+
+        # > Erosion and deposition
+        gradient_x, gradient_y = numpy.gradient(terrain)
+        slope = numpy.sqrt(gradient_x * gradient_x + gradient_y * gradient_y)
+        tilt = numpy.maximum(min_tilt, slope / numpy.sqrt(1 + slope * slope))
+        capacity = sediment_capacity_factor * tilt * water * \
+            numpy.sqrt(velocity_x * velocity_x + velocity_y * velocity_y)
+        exchange = numpy.where(capacity > sediment,
+                               erode_speed * (capacity - sediment),
+                               -deposit_speed * (sediment - capacity)) * time_step
+        exchange[sea] = 0
+        # The lands are never eroded under the sea level
+        exchange = numpy.minimum(exchange, numpy.maximum(terrain - sea_level, 0))
+        terrain -= exchange
+        sediment += exchange
+
+        # > Sediment transport, backward in the velocity field with bilinear interpolation
+        sediment = _bilinear(sediment,
+                             numpy.clip(cells_x - velocity_x * time_step, 0, width - 1),
+                             numpy.clip(cells_y - velocity_y * time_step, 0, height - 1))
+
+        # > Evaporation, the sea drains the water and the sediment
+        water *= 1 - evaporate_speed * time_step
+        water[sea] = 0
+        sediment[sea] = 0
+
+    # The remaining sediment settles
+    terrain += sediment
+    logging.debug("{i} of {n} ({p}%)".format(i=iterations, n=iterations, p=100.00))
+
+    # Return the heightmap
+    return terrain
+
+
+def _bilinear(data: object, pos_x: object, pos_y: object) -> object:
+    """Sample the data at the given positions with bilinear interpolation
+    Parameters
+    ==========
+        data: object
+    numpy 2D array
+        pos_x: object
+    numpy array of the x positions, inside the data
+        pos_y: object
+    numpy array of the y positions, inside the data
+    Returns
+    =======
+        numpy array
+    The sampled values"""
+
+    cell_x = numpy.minimum(pos_x.astype(numpy.int64), data.shape[0] - 2)
+    cell_y = numpy.minimum(pos_y.astype(numpy.int64), data.shape[1] - 2)
+    x = pos_x - cell_x
+    y = pos_y - cell_y
+    return data[cell_x, cell_y] * (1 - x) * (1 - y) + data[cell_x + 1, cell_y] * x * (1 - y) + \
+        data[cell_x, cell_y + 1] * (1 - x) * y + data[cell_x + 1, cell_y + 1] * x * y
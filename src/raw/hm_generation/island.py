@@ -2,16 +2,14 @@
 # coding: utf-8
 
 import logging
-import random
-import math
 import numpy
 
-import opensimplex
 from src.helpers.chrono import chrono
+from src.raw.hm_generation.noise import Noise
 
 
 @chrono
-def generate(parameters, width: int, height: int, seed: int) -> object:
+def generate(parameters, width: int, height: int, seed: int, levels: int = None) -> object:
     """Generate a island heightmap using the given parameters
     Parameters
     ==========
@@ -39,6 +37,9 @@ def generate(parameters, width: int, height: int, seed: int) -> object:
     Radius variation max amplitude, coef applied to width or height depending what's smaller
         ease_power: int
     Modify the steep overhal value
+        levels: int
+    Number of stratums the heightmap will be quantized into. If given, the octaves that can't change
+    the stratum of a cell are skipped
         **unused
     Other unused arguments, hack to use **large_hash when calling this method
     Returns
@@ -46,6 +47,24 @@ def generate(parameters, width: int, height: int, seed: int) -> object:
         numpy 2d array
     The result of the generation"""
 
+    heightmap = generate_tile(parameters, width, height, seed, (0, width, 0, height), levels)
+    return finalize(heightmap, width, height)
+
+
+def generate_tile(parameters, width: int, height: int, seed: int, tile: tuple, levels: int = None) -> object:
+    """Generate a tile of the raw island heightmap, before its finalization
+    Parameters
+    ==========
+        parameters, width, height, seed, levels
+    Same as generate
+        tile: tuple
+    (x_start, x_end, y_start, y_end) bounds of the tile in the heightmap, only the whole heightmap
+    can skip octaves
+    Returns
+    =======
+        numpy 2d array
+    The raw heights of the tile"""
+
     # Retrieve parameters
     try:
         octaves = parameters.octaves
@@ -62,65 +81,77 @@ def generate(parameters, width: int, height: int, seed: int) -> object:
             "A required parameter is missing from the parameters : \n{err}".format(err=e))
 
     # Initialize working variables
-    heightmap = numpy.zeros((width, height), numpy.float32)
-    prng = random.Random(seed)
-    get_noise = opensimplex.OpenSimplex(seed).noise2d
-    offsets = list(map(lambda o: (prng.randint(-1000, 1000),
-                   prng.randint(-1000, 1000)), [None] * octaves))
+    x_start, x_end, y_start, y_end = tile
+    heightmap = numpy.zeros((x_end - x_start, y_end - y_start), numpy.float32)
+    noise = Noise(seed, octaves, persistence, lacunarity, initial_scale)
     scale_clamp = float(min(width, height))
     radius = radius_coef * scale_clamp / 2
     radius_center = center_radius_coef * scale_clamp / 2
     variation_amplitude = variation_amplitude_coef * scale_clamp / 2
     center_x = int(width / 2)
     center_y = int(height / 2)
-    # Some optimization of function calling
-    math_sqrt = math.sqrt
-    math_asin = math.asin
-    math_acos = math.acos
     radius_ease_power = radius ** ease_power
 
-    # Generating each value
-    for x in range(width):
-        for y in range(height):
-            # Center exclusion
-            if x == center_x and y == center_y:
-                continue
-            # Init and calculate distance
-            value = 0.0
-            distance = math_sqrt(
-                (center_x - x) * (center_x - x) + (center_y - y) * (center_y - y))
-            if distance <= radius:
-                # Calculate variation of the circle radius
-                angle = math_asin((y - center_y) / distance) * \
-                    math_acos((x - center_x) / distance)
-                angle_noise = (get_noise(angle, 0) + 1) / 2
-                variation = variation_amplitude * angle_noise
-                if distance <= radius - variation:
-                    # Emerged lands = calculate height
-                    # Calculate ease coefficient
-                    coef_ease = 1 - (distance ** ease_power) / \
-                        radius_ease_power
-                    # Radius variation coefficient
-                    if distance <= radius_center:
-                        coef_variation = 1
-                    else:
-                        coef_variation = 1 - \
-                            (distance - radius_center) / \
-                            (radius - variation - radius_center)
-                    # Actual height calculation based on noise
-                    scale = initial_scale
-                    weight = 1.0
-                    for ox, oy in offsets:
-                        # Each octave have less impact than the previous
-                        value += (get_noise(ox + scale * x / scale_clamp,
-                                  oy + scale * y / scale_clamp) + 1) * weight
-                        weight *= persistence
-                        scale *= lacunarity
-                    # Apply island ease to sea coefficients
-                    value = value * coef_ease * coef_variation
-
-            # Store height
-            heightmap[x, y] = value
+    # Distance of each cell to the center, the center itself is excluded
+    delta_x = numpy.arange(x_start, x_end, dtype=numpy.int64)[:, None] - center_x
+    delta_y = numpy.arange(y_start, y_end, dtype=numpy.int64)[None, :] - center_y
+    distance = numpy.sqrt(delta_x * delta_x + delta_y * delta_y)
+    in_radius = distance <= radius
+    if x_start <= center_x < x_end and y_start <= center_y < y_end:
+        in_radius[center_x - x_start, center_y - y_start] = False
+
+    # Calculate variation of the circle radius for the cells inside the radius
+    tile_x, tile_y = numpy.nonzero(in_radius)
+    distance = distance[tile_x, tile_y]
+    cells_x, cells_y = tile_x + x_start, tile_y + y_start
+    angle = numpy.arcsin((cells_y - center_y) / distance) * \
+        numpy.arccos((cells_x - center_x) / distance)
+    angle_noise = (noise.noise2d(angle, numpy.zeros_like(angle)) + 1) / 2
+    variation = variation_amplitude * angle_noise
+
+    # Only keep the emerged lands
+    emerged = distance <= radius - variation
+    tile_x, tile_y = tile_x[emerged], tile_y[emerged]
+    cells_x, cells_y = cells_x[emerged], cells_y[emerged]
+    distance, variation = distance[emerged], variation[emerged]
+
+    # Calculate ease coefficient
+    coef_ease = 1 - (distance ** ease_power) / radius_ease_power
+    # Radius variation coefficient
+    coef_variation = numpy.where(
+        distance <= radius_center, 1.0,
+        1 - (distance - radius_center) / (radius - variation - radius_center))
+
+    # Actual height calculation based on noise
+    if levels:
+        # The sea is part of the normalization
+        background = 0.0 if len(cells_x) < width * height - 1 else None
+        values, _saved = noise.quantized_fbm(cells_x, cells_y, scale_clamp, levels,
+                                            coef_ease * coef_variation, background)
+    else:
+        values = noise.fbm(cells_x, cells_y, scale_clamp)
+    # Apply island ease to sea coefficients and store heights
+    heightmap[tile_x, tile_y] = values * coef_ease * coef_variation
+    return heightmap
+
+
+def finalize(heightmap: object, width: int, height: int) -> object:
+    """Finalize the raw island heightmap assembled from the tiles
+    Parameters
+    ==========
+        heightmap: object
+    The raw heightmap
+        width: int
+    The heightmap width
+        height: int
+    The heightmap height
+    Returns
+    =======
+        numpy 2d array
+    The heightmap, values between 0.0 and 1.0"""
+
+    center_x = int(width / 2)
+    center_y = int(height / 2)
 
     # Set the center value to the average of 4 neightbour
     heightmap[center_x, center_y] = (heightmap[center_x, center_y - 1] +
@@ -132,9 +163,9 @@ def generate(parameters, width: int, height: int, seed: int) -> object:
     lowest = numpy.amin(heightmap)
     highest = numpy.amax(heightmap)
     if lowest != highest:
-        delta = highest - lowest
-        heightmap = numpy.array(
-            list(map(lambda v: (v - lowest) / delta, heightmap)), numpy.float64)
+        heightmap -= lowest
+        heightmap /= highest - lowest
+        heightmap = heightmap.astype(numpy.float64)
 
     # Return the heightmap
     return heightmap
@@ -0,0 +1,334 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import logging
+import random
+
+import numpy
+
+
+class Noise():
+    """Batched 2D OpenSimplex noise and fractal brownian motion, evaluated over whole coordinate arrays.
+    It gives the same values as the opensimplex (0.3) OpenSimplex(seed).noise2d for the same seed.
+    Parameters
+    ==========
+        seed: int
+    The randomness seed, used for the permutation table and the octave offsets
+        octaves: int
+    The number of octave in fbm
+        persistence: float
+    The persistence of the fbm, weight factor between two octaves
+        lacunarity: float
+    The lacunarity of the fbm, scale factor between two octaves
+        initial_scale: float
+    The scale of the first octave
+        offsets: list
+    [(offset_x, offset_y)] for each octave, seeded offsets are generated if None"""
+
+    STRETCH_CONSTANT = -0.211324865405187   # (1/Math.sqrt(2+1)-1)/2
+    SQUISH_CONSTANT = 0.366025403784439     # (Math.sqrt(2+1)-1)/2
+    NORM_CONSTANT = 47
+    # Gradients approximate the directions to the vertices of an octagon from the center
+    GRADIENTS = numpy.array([5, 2, 2, 5, -5, 2, -2, 5,
+                             5, -2, 2, -5, -5, -2, -2, -5], numpy.int64)
+    # Amount of points evaluated at once, it bounds the memory used by the temporary arrays
+    CHUNK_SIZE = 1 << 18
+
+    @staticmethod
+    def octave_offsets(seed: int, octaves: int) -> list:
+        """Create the seeded offsets of the octaves
+        Parameters
+        ==========
+            seed: int
+        The randomness seed
+            octaves: int
+        The number of octaves
+        Returns
+        =======
+            list [(offset_x, offset_y)]"""
+
+        prng = random.Random(seed)
+        return list(map(lambda o: (prng.randint(-1000, 1000),
+                    prng.randint(-1000, 1000)), [None] * octaves))
+
+    def __init__(self, seed: int, octaves: int = 1, persistence: float = 0.5, lacunarity: float = 2,
+                 initial_scale: float = 1, offsets: list = None):
+        self._perm = self._permutation(seed)
+        self._offsets = offsets if offsets is not None else self.octave_offsets(
+            seed, octaves)
+        # Scale and weight of each octave
+        self._scales = []
+        self._weights = []
+        scale = initial_scale
+        weight = 1.0
+        for _ in self._offsets:
+            self._scales.append(scale)
+            self._weights.append(weight)
+            weight *= persistence
+            scale *= lacunarity
+
+    @property
+    def offsets(self) -> list:
+        """Access the octave offsets property"""
+        return self._offsets
+
+    @property
+    def octaves(self) -> int:
+        """Access the octave count property"""
+        return len(self._offsets)
+
+    @property
+    def weights(self) -> list:
+        """Access the octave weights property"""
+        return self._weights
+
+    def fbm(self, xs: numpy.ndarray, ys: numpy.ndarray, scale_clamp: float = 1.0) -> numpy.ndarray:
+        """Sum all the octaves of the noise at the given coordinates
+        Parameters
+        ==========
+            xs: numpy.ndarray
+        X coordinates of the points
+            ys: numpy.ndarray
+        Y coordinates of the points, same shape as xs
+            scale_clamp: float
+        The coordinates are divided by this value before being scaled
+        Returns
+        =======
+            numpy.ndarray
+        Values between 0 and 2 * sum(weights), same shape as the coordinates"""
+
+        value = numpy.zeros(numpy.shape(xs), numpy.float64)
+        for octave in range(self.octaves):
+            # Each octave have less impact than the previous
+            value += self.octave(octave, xs, ys, scale_clamp) * \
+                self._weights[octave]
+        return value
+
+    def quantized_fbm(self, xs: numpy.ndarray, ys: numpy.ndarray, scale_clamp: float, levels: int,
+                      coefs: numpy.ndarray = 1.0, background: float = None) -> tuple:
+        """Sum the octaves of the noise, but stop evaluating the points whose level is already decided
+        once the values are normalized and quantized into the given number of levels.
+        After each octave, the remaining octaves can add at most 2 * weight each. It bounds the final value
+        of each point, and so the final lowest and highest values used by the normalization. When the
+        lowest and the highest possible level of a point are the same, the next octaves are skipped and the
+        point takes the expected value of the remaining octaves. The levels are the same as the ones of fbm.
+        Parameters
+        ==========
+            xs: numpy.ndarray
+        X coordinates of the points, 1d array
+            ys: numpy.ndarray
+        Y coordinates of the points, 1d array
+            scale_clamp: float
+        The coordinates are divided by this value before being scaled
+            levels: int
+        Number of levels of the quantization
+            coefs: numpy.ndarray or float
+        Positive coefficients applied to the values before the normalization
+            background: float
+        Value of the points that are not evaluated but are part of the normalization, None if there is none
+        Returns
+        =======
+            tuple (numpy.ndarray, int)
+        The values, same as fbm for the fully evaluated points, and the number of noise evaluations saved"""
+
+        count = len(xs)
+        coefs = numpy.broadcast_to(numpy.asarray(coefs, numpy.float64), (count,))
+        values = numpy.zeros(count, numpy.float64)
+        # Bounds of the final values, before the coefficients
+        low = numpy.zeros(count, numpy.float64)
+        high = numpy.full(count, 2 * sum(self._weights), numpy.float64)
+        active = numpy.arange(count)
+        evaluations = 0
+
+        for octave in range(self.octaves):
+            evaluations += len(active)
+            values[active] += self.octave(octave, xs[active], ys[active], scale_clamp) * \
+                self._weights[octave]
+            remaining = 2 * sum(self._weights[octave + 1:])
+            low[active] = values[active]
+            high[active] = values[active] + remaining
+            if remaining == 0 or len(active) == 0:
+                break
+
+            # Bounds of the lowest and highest values of the normalization
+            low_coefs, high_coefs = low * coefs, high * coefs
+            lowest = [numpy.amin(low_coefs), numpy.amin(high_coefs)]
+            highest = [numpy.amax(low_coefs), numpy.amax(high_coefs)]
+            if background is not None:
+                lowest = [min(v, background) for v in lowest]
+                highest = [max(v, background) for v in highest]
+            if highest[0] <= lowest[1]:
+                continue
+            # Lowest and highest possible levels of the active points
+            lowest_level = numpy.floor((low_coefs[active] - lowest[1]) *
+                                       levels / (highest[1] - lowest[1]))
+            highest_level = numpy.floor((high_coefs[active] - lowest[0]) *
+                                        levels / (highest[0] - lowest[0]))
+            decided = numpy.clip(lowest_level, 0, levels) == numpy.clip(
+                highest_level, 0, levels)
+            # The points that can be the lowest or the highest are always fully evaluated
+            # this way the normalization doesn't depend on the skipped octaves
+            decided &= (low_coefs[active] > lowest[1]) & (
+                high_coefs[active] < highest[0])
+
+            # Decided points take the expected value of the remaining octaves
+            decided_points = active[decided]
+            values[decided_points] += remaining / 2
+            low[decided_points] = high[decided_points] = values[decided_points]
+            active = active[~decided]
+
+        # Report the saved evaluations
+        saved = count * self.octaves - evaluations
+        logging.info("Octave skipping saved {s} of {t} noise evaluations ({p}%)".format(
+            s=saved, t=count * self.octaves, p=round(10000 * saved / max(count * self.octaves, 1)) / 100))
+        return values, saved
+
+    def octave(self, octave: int, xs: numpy.ndarray, ys: numpy.ndarray, scale_clamp: float = 1.0) -> numpy.ndarray:
+        """Calculate one unweighted octave of the fbm at the given coordinates
+        Parameters
+        ==========
+            octave: int
+        Index of the octave
+            xs: numpy.ndarray
+        X coordinates of the points
+            ys: numpy.ndarray
+        Y coordinates of the points, same shape as xs
+            scale_clamp: float
+        The coordinates are divided by this value before being scaled
+        Returns
+        =======
+            numpy.ndarray
+        Values between 0 and 2, same shape as the coordinates"""
+
+        ox, oy = self._offsets[octave]
+        scale = self._scales[octave]
+        return self.noise2d(ox + scale * numpy.asarray(xs) / scale_clamp,
+                            oy + scale * numpy.asarray(ys) / scale_clamp) + 1
+
+    def noise2d(self, xs: numpy.ndarray, ys: numpy.ndarray) -> numpy.ndarray:
+        """Generate 2D OpenSimplex noise from arrays of coordinates
+        Parameters
+        ==========
+            xs: numpy.ndarray
+        X coordinates of the points
+            ys: numpy.ndarray
+        Y coordinates of the points, same shape as xs
+        Returns
+        =======
+            numpy.ndarray
+        Values between -1 and 1, same shape as the coordinates"""
+
+        xs = numpy.asarray(xs, numpy.float64)
+        ys = numpy.asarray(ys, numpy.float64)
+        shape = xs.shape
+        xs, ys = xs.ravel(), ys.ravel()
+        values = numpy.empty(len(xs), numpy.float64)
+        for start in range(0, len(xs), self.CHUNK_SIZE):
+            end = start + self.CHUNK_SIZE
+            values[start:end] = self._noise2d(xs[start:end], ys[start:end])
+        return values.reshape(shape)
+
+    def _noise2d(self, x: numpy.ndarray, y: numpy.ndarray) -> numpy.ndarray:
+        """Vectorized OpenSimplex 2D noise, the operations are made in the same order than the
+        reference implementation to get the exact same values"""
+
+        where = numpy.where
+        squish = self.SQUISH_CONSTANT
+        extrapolate = self._extrapolate
+
+        # Place input coordinates onto grid.
+        stretch_offset = (x + y) * self.STRETCH_CONSTANT
+        xs = x + stretch_offset
+        ys = y + stretch_offset
+        # Floor to get grid coordinates of rhombus (stretched square) super-cell origin.
+        xsb = numpy.floor(xs).astype(numpy.int64)
+        ysb = numpy.floor(ys).astype(numpy.int64)
+        # Skew out to get actual coordinates of rhombus origin.
+        squish_offset = (xsb + ysb) * squish
+        xb = xsb + squish_offset
+        yb = ysb + squish_offset
+        # Compute grid coordinates relative to rhombus origin.
+        xins = xs - xsb
+        yins = ys - ysb
+        # Sum those together to get a value that determines which region we're in.
+        in_sum = xins + yins
+        # Positions relative to origin point.
+        dx0 = x - xb
+        dy0 = y - yb
+
+        # Contribution (1,0)
+        dx1 = dx0 - 1 - squish
+        dy1 = dy0 - 0 - squish
+        value = extrapolate(xsb + 1, ysb + 0, dx1, dy1)
+        # Contribution (0,1)
+        dx2 = dx0 - 0 - squish
+        dy2 = dy0 - 1 - squish
+        value += extrapolate(xsb + 0, ysb + 1, dx2, dy2)
+
+        # Extra vertex, depending on the triangle (2-Simplex) we're inside
+        lower = in_sum <= 1
+        xins_greater = xins > yins
+        zins = where(lower, 1 - in_sum, 2 - in_sum)
+        # (0,0) is one of the closest two triangular vertices
+        closest = where(lower, (zins > xins) | (zins > yins),
+                        (zins < xins) | (zins < yins))
+        # Inside the triangle at (0,0)
+        lower_x = lower & closest & xins_greater
+        lower_y = lower & closest & ~xins_greater
+        lower_xy = lower & ~closest
+        # Inside the triangle at (1,1)
+        upper_x = ~lower & closest & xins_greater
+        upper_y = ~lower & closest & ~xins_greater
+        xsv_ext = numpy.select([lower_x, lower_y, lower_xy, upper_x, upper_y],
+                               [xsb + 1, xsb - 1, xsb + 1, xsb + 2, xsb + 0], xsb)
+        ysv_ext = numpy.select([lower_x, lower_y, lower_xy, upper_x, upper_y],
+                               [ysb - 1, ysb + 1, ysb + 1, ysb + 0, ysb + 2], ysb)
+        dx_ext = numpy.select([lower_x, lower_y, lower_xy, upper_x, upper_y],
+                              [dx0 - 1, dx0 + 1, dx0 - 1 - 2 * squish,
+                               dx0 - 2 - 2 * squish, dx0 + 0 - 2 * squish], dx0)
+        dy_ext = numpy.select([lower_x, lower_y, lower_xy, upper_x, upper_y],
+                              [dy0 + 1, dy0 - 1, dy0 - 1 - 2 * squish,
+                               dy0 + 0 - 2 * squish, dy0 - 2 - 2 * squish], dy0)
+        # The origin moves to (1,1) in the upper triangle
+        xsb = where(lower, xsb, xsb + 1)
+        ysb = where(lower, ysb, ysb + 1)
+        dx0 = where(lower, dx0, dx0 - 1 - 2 * squish)
+        dy0 = where(lower, dy0, dy0 - 1 - 2 * squish)
+
+        # Contribution (0,0) or (1,1)
+        value += extrapolate(xsb, ysb, dx0, dy0)
+        # Extra Vertex
+        value += extrapolate(xsv_ext, ysv_ext, dx_ext, dy_ext)
+
+        return value / self.NORM_CONSTANT
+
+    def _extrapolate(self, xsb: numpy.ndarray, ysb: numpy.ndarray, dx: numpy.ndarray, dy: numpy.ndarray) -> numpy.ndarray:
+        """Attenuated gradient contribution of the lattice points (xsb, ysb) at the offsets (dx, dy)"""
+
+        perm = self._perm
+        gradients = self.GRADIENTS
+        attn = 2 - dx * dx - dy * dy
+        # Only the points inside the attenuation radius contribute
+        inside = attn > 0
+        attn *= attn
+        index = perm[(perm[xsb & 0xFF] + ysb) & 0xFF] & 0x0E
+        return numpy.where(inside, attn * attn * (gradients[index] * dx + gradients[index + 1] * dy), 0.0)
+
+    @staticmethod
+    def _permutation(seed: int) -> numpy.ndarray:
+        """Generate the permutation table from a 64-bit seed number"""
+
+        def overflow(value):
+            # Emulate the 64-bit signed integer overflow
+            return (value + (1 << 63)) % (1 << 64) - (1 << 63)
+
+        perm = [0] * 256
+        source = list(range(256))
+        for _ in range(3):
+            seed = overflow(seed * 6364136223846793005 + 1442695040888963407)
+        for i in range(255, -1, -1):
+            seed = overflow(seed * 6364136223846793005 + 1442695040888963407)
+            r = int((seed + 31) % (i + 1))
+            perm[i] = source[r]
+            source[r] = source[i]
+        return numpy.array(perm, numpy.int64)
@@ -2,15 +2,14 @@
 # coding: utf-8
 
 import logging
-import random
 import numpy
 
-import opensimplex
 from src.helpers.chrono import chrono
+from src.raw.hm_generation.noise import Noise
 
 
 @chrono
-def generate(parameters, width: int, height: int, seed: int) -> object: #, octaves: int, persistence: float, lacunarity: float, initial_scale: float, **unused) -> object:
+def generate(parameters, width: int, height: int, seed: int, levels: int = None) -> object: #, octaves: int, persistence: float, lacunarity: float, initial_scale: float, **unused) -> object:
     """Generate a simple heightmap using the given parameters
     Parameters
     ==========
@@ -28,6 +27,9 @@ def generate(parameters, width: int, height: int, seed: int) -> object: #, octav
     The lacunarity of the noise
         initial_scale: float
     The initial scale of the noise
+        levels: int
+    Number of stratums the heightmap will be quantized into. If given, the octaves that can't change
+    the stratum of a cell are skipped
         **unused
     Other unused arguments, hack to use **large_hash when calling this method
     Returns
@@ -35,6 +37,24 @@ def generate(parameters, width: int, height: int, seed: int) -> object: #, octav
         numpy array
     The result of the generation"""
 
+    heightmap = generate_tile(parameters, width, height, seed, (0, width, 0, height), levels)
+    return finalize(heightmap, width, height)
+
+
+def generate_tile(parameters, width: int, height: int, seed: int, tile: tuple, levels: int = None) -> object:
+    """Generate a tile of the raw simple heightmap, before its finalization
+    Parameters
+    ==========
+        parameters, width, height, seed, levels
+    Same as generate
+        tile: tuple
+    (x_start, x_end, y_start, y_end) bounds of the tile in the heightmap, only the whole heightmap
+    can skip octaves
+    Returns
+    =======
+        numpy 2d array
+    The raw heights of the tile"""
+
     # Retrieve parameters
     try:
         octaves = parameters.octaves
@@ -46,34 +66,40 @@ def generate(parameters, width: int, height: int, seed: int) -> object: #, octav
             "A required parameter is missing from the parameters : \n{err}".format(err=e))
 
     # Initialize working variables
-    heightmap = numpy.zeros((width, height), numpy.float64)
-    prng = random.Random(seed)
-    get_noise = opensimplex.OpenSimplex(seed).noise2d
-    offsets = list(map(lambda o: (prng.randint(-1000, 1000),
-                   prng.randint(-1000, 1000)), [None] * octaves))
+    noise = Noise(seed, octaves, persistence, lacunarity, initial_scale)
     scale_clamp = float(min(width, height))
 
     # Generating each value
-    for x in range(width):
-        for y in range(height):
-            value = 0.0
-            scale = initial_scale
-            weight = 1.0
-            for ox, oy in offsets:
-                # Each octave have less impact than the previous
-                value = value + (get_noise(ox + scale * x / scale_clamp, oy + scale * y / scale_clamp) + 1) * weight
-                weight = weight * persistence
-                scale = scale * lacunarity
-            # Store height
-            heightmap[x, y] = value
+    x_start, x_end, y_start, y_end = tile
+    cells_x, cells_y = numpy.indices((x_end - x_start, y_end - y_start))
+    cells_x, cells_y = cells_x + x_start, cells_y + y_start
+    if levels:
+        values, _saved = noise.quantized_fbm(cells_x.ravel(), cells_y.ravel(), scale_clamp, levels)
+        return values.reshape(cells_x.shape)
+    return noise.fbm(cells_x, cells_y, scale_clamp)
+
+
+def finalize(heightmap: object, width: int, height: int) -> object:
+    """Finalize the raw simple heightmap assembled from the tiles
+    Parameters
+    ==========
+        heightmap: object
+    The raw heightmap
+        width: int
+    The heightmap width
+        height: int
+    The heightmap height
+    Returns
+    =======
+        numpy 2d array
+    The heightmap, values between 0.0 and 1.0"""
 
     # Correcting data to put them between -1.0 and 1.0
     lowest = numpy.amin(heightmap)
     highest = numpy.amax(heightmap)
     if lowest != highest:
-        delta = highest - lowest
-        heightmap = numpy.array(
-            list(map(lambda v: (v - lowest) / delta, heightmap)), numpy.float64)
+        heightmap -= lowest
+        heightmap /= highest - lowest
 
     # Return the heightmap
     return heightmap
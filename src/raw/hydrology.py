@@ -0,0 +1,176 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import logging
+
+import numpy
+from src.helpers.chrono import chrono
+from src.helpers.shift import shifted_slices
+from src.raw.cliffs import Cliffs
+
+
+class Hydrology():
+    """Flow graph of a heightmap : each cell flows to one receiver, the flow accumulation of a cell is the
+    sum of the weights of the cells upstream of it, itself included.
+    A cell flows to its lowest neighbour among the 4 neighbours lower than itself. The water only crosses
+    the vertical cliffs, in their direction, and only downward. The sea cells and the cells without lower
+    neighbour are sinks.
+    Parameters
+    ==========
+        heightmap: object
+    A numpy 2d array that contains all the heights of the map
+        cliffmap: object
+    A numpy 2d array of the cliff codes
+        width: int
+    Width of the 2d arrays
+        height: int
+    Height of the 2d arrays
+        sea_level: float
+    Height of the sea, the cells at or under it are sinks"""
+
+    DIR_4_OFFSETS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+
+    def __init__(self, heightmap: object, cliffmap: object, width: int, height: int, sea_level: float):
+        self._heightmap = heightmap
+        self._cliffmap = cliffmap
+        self._width = width
+        self._height = height
+        self._sea_level = sea_level
+
+    @property
+    def receivers(self):
+        """Access the receivers property : flat index of the receiver of each cell, -1 for the sinks"""
+        return self._receivers
+
+    @staticmethod
+    def vertical_cliffs(cliffmap: object) -> object:
+        """Find the cliffs the water can cross
+        Parameters
+        ==========
+            cliffmap: object
+        A numpy 2d array of the cliff codes
+        Returns
+        =======
+            numpy 2d array
+        The y direction of the crossing, 0 if the cell can't be crossed"""
+
+        vertical = numpy.zeros(256, numpy.int8)
+        vertical[Cliffs.NORTH_MASK] = Cliffs.dir_vector(Cliffs.NORTH_MASK)[1]
+        vertical[Cliffs.SOUTH_MASK] = Cliffs.dir_vector(Cliffs.SOUTH_MASK)[1]
+        return vertical[cliffmap]
+
+    @chrono
+    def calculate_directions(self):
+        """Calculate the receiver of each cell"""
+
+        # Retrieve working variables
+        width, height = self._width, self._height
+        heightmap = self._heightmap
+        cliffmap = self._cliffmap
+        indices = numpy.arange(width * height, dtype=numpy.int32).reshape(width, height)
+
+        # The water only flows through the vertical cliffs, in their direction
+        vertical = self.vertical_cliffs(cliffmap)
+        enterable = (cliffmap == 0) | (vertical != 0)
+
+        # Lowest lower neighbour, the first direction wins the ties
+        receivers = numpy.full((width, height), -1, numpy.int32)
+        drops = numpy.zeros((width, height))
+        for dir_x, dir_y in self.DIR_4_OFFSETS:
+            cells, neighbours = shifted_slices(dir_x, dir_y, width, height)
+            drop = numpy.where(enterable[neighbours], heightmap[cells] - heightmap[neighbours], 0)
+            steeper = drop > drops[cells]
+            drops[cells][steeper] = drop[steeper]
+            receivers[cells][steeper] = indices[neighbours][steeper]
+
+        # Cliffs
+        receivers[cliffmap != 0] = -1
+        for dir_y in (-1, 1):
+            cells, neighbours = shifted_slices(0, dir_y, width, height)
+            crossing = (vertical[cells] == dir_y) & enterable[neighbours] & (heightmap[neighbours] < heightmap[cells])
+            receivers[cells][crossing] = indices[neighbours][crossing]
+
+        # Sea
+        receivers[heightmap <= self._sea_level] = -1
+        self._receivers = receivers.reshape(-1)
+
+    def accumulate(self, weights: object, receivers: object = None) -> object:
+        """Accumulate weights downstream, the cells are processed by fronts : a cell is added to its receiver
+        once all its upstream cells are processed. A cycle of receivers (a drain that flows back into its
+        pool) would never be processed : its lowest cell becomes a sink with a warning, so the weights that
+        reach the cycle end there instead of being lost
+        Parameters
+        ==========
+            weights: object
+        numpy array of the weight of each cell, 2d or flat
+            receivers: object
+        Optional, flat numpy array of the receivers to use instead of the flow directions, it isn't modified
+        Returns
+        =======
+            numpy 2d array
+        The flow accumulation"""
+
+        receivers = self._receivers if receivers is None else receivers
+        accumulation = numpy.array(weights, numpy.float64).reshape(-1)
+        flowing = receivers != -1
+        # Number of unprocessed upstream cells
+        upstreams = numpy.bincount(receivers[flowing], minlength=receivers.size)
+        front = numpy.flatnonzero(flowing & (upstreams == 0))
+        while True:
+            while front.size > 0:
+                targets = receivers[front]
+                numpy.add.at(accumulation, targets, accumulation[front])
+                numpy.subtract.at(upstreams, targets, 1)
+                targets = numpy.unique(targets)
+                front = targets[(upstreams[targets] == 0) & flowing[targets]]
+            # A cell has only one receiver, so the cells left are on cycles
+            cycles = numpy.flatnonzero(flowing & (upstreams > 0))
+            if cycles.size == 0:
+                break
+            sinks = self._cycles_sinks(receivers, cycles)
+            logging.warning("{c} cells of the flow graph are on {n} cycles, their lowest cells become sinks".format(
+                c=cycles.size, n=sinks.size))
+            # Break the cycles, the next cells of the cycles can be processed
+            receivers = receivers.copy()
+            targets = receivers[sinks]
+            receivers[sinks] = -1
+            flowing[sinks] = False
+            numpy.subtract.at(upstreams, targets, 1)
+            front = targets[(upstreams[targets] == 0) & flowing[targets]]
+        return accumulation.reshape(self._width, self._height)
+
+    def _cycles_sinks(self, receivers: object, cycles: object) -> object:
+        """Find the lowest cell of each cycle of receivers
+        Parameters
+        ==========
+            receivers: object
+        Flat numpy array of the receivers
+            cycles: object
+        numpy array of the flat indices of all the cells on cycles
+        Returns
+        =======
+            numpy array
+        The flat index of the lowest cell of each cycle"""
+
+        heights = self._heightmap.reshape(-1)
+        remaining = set(cycles.tolist())
+        sinks = []
+        while remaining:
+            start = remaining.pop()
+            lowest = cell = start
+            cell = int(receivers[cell])
+            while cell != start:
+                remaining.discard(cell)
+                if heights[cell] < heights[lowest]:
+                    lowest = cell
+                cell = int(receivers[cell])
+            sinks.append(lowest)
+        return numpy.array(sinks, numpy.int64)
+
+    def accumulation(self) -> object:
+        """Calculate the drainage area of each cell, in cells
+        Returns
+        =======
+            numpy 2d array"""
+
+        return self.accumulate(numpy.ones(self._width * self._height))
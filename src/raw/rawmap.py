@@ -6,6 +6,7 @@ import numpy
 
 class RawMap:
     """Class that contains raw map data
+    The stratums are level indices, the height of the level l is stratums_base + l * stratums_step
     Parameters
     ==========
         width: int
@@ -19,7 +20,9 @@ class RawMap:
         self.final_width = self.width = self.working_width * 2
         self.final_height = self.height = self.working_height * 2
         self.heightmap = numpy.zeros((1, 1), numpy.float64)
-        self.stratums = numpy.zeros((1, 1), numpy.float64)
+        self.stratums = numpy.zeros((1, 1), numpy.uint8)
+        self.stratums_step = 0.0
+        self.stratums_base = 0.0
         self.cliffs = numpy.zeros((1, 1), numpy.uint8)
         self.rivermap = numpy.zeros((1, 1), numpy.float64)
         self.poolmap = numpy.zeros((1, 1), numpy.float64)
@@ -31,7 +34,7 @@ class RawMap:
         Parameters
         ==========
             arr: list
-        [width, height, heightmap, stratums, cliffs, rgb_cliffs]
+        [width, height, heightmap, stratums, cliffs, rivermap, poolmap, waterfallmap, stratums_step, stratums_base]
         Returns
         =======
             RawMap"""
@@ -47,6 +50,9 @@ class RawMap:
         rm.rivermap = arr[5]
         rm.poolmap = arr[6]
         rm.waterfallmap = arr[7]
+        if len(arr) > 8:
+            rm.stratums_step = arr[8]
+            rm.stratums_base = arr[9]
         # Return the result
         return rm
 
@@ -56,7 +62,8 @@ class RawMap:
         =======
             list"""
 
-        return [self.width, self.height, self.heightmap, self.stratums, self.cliffs, self.rivermap, self.poolmap, self.waterfallmap]
+        return [self.width, self.height, self.heightmap, self.stratums, self.cliffs, self.rivermap, self.poolmap, self.waterfallmap,
+                self.stratums_step, self.stratums_base]
 
     def clone(self) -> object:
         """Make a clone of the RawMap and all its arrays"""
@@ -68,4 +75,15 @@ class RawMap:
         rawmap.rivermap = numpy.copy(self.rivermap)
         rawmap.poolmap = numpy.copy(self.poolmap)
         rawmap.waterfallmap = numpy.copy(self.waterfallmap)
-        return rawmap
\ No newline at end of file
+        rawmap.stratums_step = self.stratums_step
+        rawmap.stratums_base = self.stratums_base
+        return rawmap
+
+    def stratums_heights(self) -> object:
+        """Convert the stratums level indices into heights
+        Returns
+        =======
+            numpy 2d array
+        The height of the stratum of each cell"""
+
+        return self.stratums_base + self.stratums.astype(numpy.float64) * self.stratums_step
\ No newline at end of file
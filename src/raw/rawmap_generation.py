@@ -2,6 +2,7 @@
 # coding: utf-8
 
 import collections
+import concurrent.futures
 import importlib
 import logging
 import os
@@ -10,10 +11,11 @@ import numpy
 from src.generation_step_manager import GenerationStepManager
 from src.helpers.chrono import chrono
 from src.helpers.resize import resize_data
+from src.helpers.tiles import split_tiles
 from src.raw.cliffs import Cliffs
-from src.raw.erosion import Erosion
 from src.raw.rawmap import RawMap
 from src.raw.stratums import Stratums
+from src.raw.thermal_erosion import ThermalErosion
 from src.raw.waterfalls import Waterfalls
 from src.raw.waters import Waters
 
@@ -29,7 +31,8 @@ class RawMapGeneration():
         debug_enabled: bool
     True if the debug is enabled, needs to be false in the releases
         debug_step: int
-    The step where to begin the rawmap generation
+    The step where to begin the rawmap generation, see STEPS. The steps after the erosion moved up by one
+    when the thermal erosion step was added, the rawmap_steps.bin files saved before are ignored
     Parameters.parameters
     =====================
     What attribute the parameters argument needs to have
@@ -41,21 +44,26 @@ class RawMapGeneration():
     Another object with heightmap generation, specific to each generation types
         erosion
     Another object with erosion parameters, specific to the erosion module
+        thermal_erosion
+    Optional object with the thermal erosion parameters, the pass is skipped without it
         cliff_mapping
     Another object with cliff mapping parmaters, specific to the cliff mapping module"""
 
     STEPS = collections.namedtuple('Steps',
-                                   ['heightmap', 'erosion', 'stratums', 'cliffs', 'waters', 'resizing', 'waterfalls'])(1, 2, 3, 4, 5, 6, 7)
+                                   ['heightmap', 'erosion', 'thermal_erosion', 'stratums', 'cliffs', 'waters', 'resizing', 'waterfalls'])(1, 2, 3, 4, 5, 6, 7, 8)
+    # Saved with the steps, the steps files of another layout (before the thermal erosion step) are ignored
+    STEPS_VERSION = tuple(STEPS._asdict().items())
 
     def __init__(self, parameters: object, path_to_outputs: str, debug_enabled: bool, debug_step: int):
         # Setup attributes
         self._parameters = parameters
         self._path_to_outputs = path_to_outputs
+        self._debug_enabled = debug_enabled
 
         # Init the step manager and the generated data
         path_to_steps = os.path.join(self._path_to_outputs, "rawmap_steps.bin")
         self._step_manager = GenerationStepManager(
-            debug_enabled, path_to_steps, debug_step, RawMap)
+            debug_enabled, path_to_steps, debug_step, RawMap, self.STEPS_VERSION)
         self._step_manager.load()
         self._step_manager.init_data(
             self._parameters.map.width, self._parameters.map.height)
@@ -81,6 +89,9 @@ class RawMapGeneration():
         # Erode the heightmap
         self._erode()
 
+        # Relax the slopes above the talus
+        self._thermal_erode()
+
         # Cliff mapping
         self._cliff_mapping()
 
@@ -99,6 +110,13 @@ class RawMapGeneration():
             seed = self._parameters.seed
             hmgen_parameters = self._parameters.heightmap_generation
             hmgen_module_name = self._parameters.heightmap_generation.type
+            # Optional parallel generation: 1 worker = single process, 0 = one worker per CPU
+            hmgen_workers = getattr(hmgen_parameters, 'workers', 1)
+            hmgen_tile_size = getattr(hmgen_parameters, 'tile_size', 256)
+            # Optional octave skipping against the stratums quantization
+            hmgen_levels = None
+            if getattr(hmgen_parameters, 'octave_skipping', False):
+                hmgen_levels = self._parameters.cliff_mapping.step_count
         except AttributeError as e:
             logging.critical(
                 "A required parameter is missing from the parameters : \n{err}".format(err=e))
@@ -114,30 +132,107 @@ class RawMapGeneration():
         # Actually generate the heightmap
         @self._step_manager.make_step(self.STEPS.heightmap)
         def heightmap():
-            self.rawmap.heightmap = hmgen_module.generate(
-                hmgen_parameters, self.rawmap.working_width, self.rawmap.working_height, seed)
+            if hmgen_levels:
+                # The octave skipping needs the whole heightmap
+                if hmgen_workers != 1:
+                    logging.warning(
+                        "The octave skipping can't be used with tiles, the heightmap is generated in a single process.")
+                self.rawmap.heightmap = hmgen_module.generate(
+                    hmgen_parameters, self.rawmap.working_width, self.rawmap.working_height, seed, levels=hmgen_levels)
+            elif hmgen_workers != 1 and hasattr(hmgen_module, 'generate_tile'):
+                self.rawmap.heightmap = self._generate_tiled_heightmap(
+                    hmgen_module, hmgen_parameters, seed, hmgen_workers, hmgen_tile_size)
+            else:
+                self.rawmap.heightmap = hmgen_module.generate(
+                    hmgen_parameters, self.rawmap.working_width, self.rawmap.working_height, seed)
             return self.rawmap
         heightmap()
 
+    @chrono
+    def _generate_tiled_heightmap(self, hmgen_module: object, hmgen_parameters: object, seed: int, workers: int, tile_size: int) -> object:
+        """Generate the heightmap tile by tile in a process pool.
+        Every tile derives the same octave offsets from the seed, so the result is identical to
+        a single process generation.
+        Parameters
+        ==========
+            hmgen_module: module
+        The heightmap generation module, it must implement generate_tile and finalize
+            hmgen_parameters: object
+        The heightmap generation parameters
+            seed: int
+        The randomness seed
+            workers: int
+        Number of processes, 0 to use all the CPUs
+            tile_size: int
+        Width and height of the tiles
+        Returns
+        =======
+            numpy 2d array
+        The heightmap"""
+
+        width, height = self.rawmap.working_width, self.rawmap.working_height
+        tiles = split_tiles(width, height, tile_size)
+        heightmap = None
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers or None) as executor:
+            futures = [executor.submit(hmgen_module.generate_tile, hmgen_parameters, width, height, seed, tile)
+                       for tile in tiles]
+            # Assemble the tiles
+            for (x_start, x_end, y_start, y_end), future in zip(tiles, futures):
+                data = future.result()
+                if heightmap is None:
+                    heightmap = numpy.zeros((width, height), data.dtype)
+                heightmap[x_start:x_end, y_start:y_end] = data
+        return hmgen_module.finalize(heightmap, width, height)
+
     def _erode(self):
         # Retrieve erosion parameters
         try:
             seed = self._parameters.seed
             erosion_parameters = self._parameters.erosion
+            # The droplets erosion is the historical one, it's used when no type is given
+            erosion_module_name = getattr(erosion_parameters, 'type', 'droplets')
         except AttributeError as e:
             logging.critical(
                 "A required parameter is missing from the parameters : \n{err}".format(err=e))
 
+        # Retrieve the erosion module
+        try:
+            erosion_module_name = __package__ + ".erosion_types." + erosion_module_name
+            erosion_module = importlib.import_module(erosion_module_name)
+        except ImportError as e:
+            logging.critical("Impossible to load the erosion module named : '{mod}'\n{err}".format(
+                mod=erosion_module_name, err=e))
+
+        # In debug, an interrupted erosion resumes from its checkpoint saved next to the steps
+        checkpoint_path = None
+        if self._debug_enabled:
+            checkpoint_path = os.path.join(self._path_to_outputs, "erosion_checkpoint.bin")
+
         # Erode the heightmap
         @self._step_manager.make_step(self.STEPS.erosion)
         def erode():
-            erosion = Erosion(erosion_parameters, self.rawmap.heightmap,
-                              self.rawmap.working_width, self.rawmap.working_height, seed)
-            erosion.init_brushes()
-            erosion.erode()
+            self.rawmap.heightmap = erosion_module.erode(erosion_parameters, self.rawmap.heightmap,
+                                                         self.rawmap.working_width, self.rawmap.working_height, seed,
+                                                         checkpoint_path=checkpoint_path,
+                                                         path_to_outputs=self._path_to_outputs)
             return self.rawmap
         erode()
 
+    def _thermal_erode(self):
+        # Retrieve the thermal erosion parameters, the pass is optional
+        thermal_parameters = getattr(self._parameters, 'thermal_erosion', None)
+
+        # Relax the slopes of the heightmap
+        @self._step_manager.make_step(self.STEPS.thermal_erosion)
+        def thermal_erode():
+            if thermal_parameters is not None:
+                thermal_gen = ThermalErosion(thermal_parameters, self.rawmap.heightmap,
+                                             self.rawmap.working_width, self.rawmap.working_height)
+                thermal_gen.erode()
+                self.rawmap.heightmap = thermal_gen.heightmap
+            return self.rawmap
+        thermal_erode()
+
     def _cliff_mapping(self):
         # Retrieve cliff mapping parameters
         try:
@@ -153,6 +248,8 @@ class RawMapGeneration():
                                 self.rawmap.working_width, self.rawmap.working_height)
             stratums.calculate_stratums()
             self.rawmap.stratums = stratums.stratums
+            self.rawmap.stratums_step = stratums.step
+            self.rawmap.stratums_base = stratums.base
             return self.rawmap
         create_stratums()
 
@@ -187,13 +284,6 @@ class RawMapGeneration():
         create_waters()
 
     def _resize(self):
-        # Retrieve cliff mapping parameters
-        try:
-            cliff_mapping_parameters = self._parameters.cliff_mapping
-        except AttributeError as e:
-            logging.critical(
-                "A required parameter is missing from the parameters : \n{err}".format(err=e))
-
         # Resize the stratums to get rid of the orphans
         @self._step_manager.make_step(self.STEPS.resizing)
         @chrono
@@ -202,11 +292,8 @@ class RawMapGeneration():
             self.rawmap.stratums, _w, _h = resize_data(
                 self.rawmap.stratums, w_width, w_height, 2)
 
-            # Recalculate the cliffs the cliff map
-            cliffs_gen = Cliffs(cliff_mapping_parameters, self.rawmap.stratums,
-                                self.rawmap.final_width, self.rawmap.final_height)
-            cliffs_gen.calculate_cliffs()
-            self.rawmap.cliffs = cliffs_gen.cliffs
+            # Upscale the cliff map, same as recalculating it on the resized stratums
+            self.rawmap.cliffs = Cliffs.upscale_cliffs(self.rawmap.cliffs, w_width, w_height, 2)
 
             # Resize the rivers and pool maps
             self.rawmap.rivermap, _w, _h = resize_data(
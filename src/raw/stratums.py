@@ -1,14 +1,18 @@
 #! /usr/bin/env python3
 # coding: utf-8
 
+import heapq
 import logging
 
 import numpy
 from src.helpers.chrono import chrono
+from src.helpers.shift import shifted_slices
 
 
 class Stratums():
     """Class that calculate the stratums of the heightmap.
+    The stratums are stored as level indices (uint8, uint16 beyond 256 levels), the height of the level l
+    is base + l * step.
     Parameters
     ==========
         parameters: object
@@ -22,7 +26,13 @@ class Stratums():
     Parameters.parameters
     =====================
         step_count: int
-    The number of stratum in the map. This will define the height of each stratum."""
+    The number of stratum in the map. This will define the height of each stratum.
+        orphans_mode: str
+    Optional, how the orphan pixels (no 4-neighbour on the same stratum) are replaced by the mean of their
+    neighbours. "scan" (default) gives the historical result: the cells are corrected in place in the (x, y)
+    scan order, so a correction is seen by the next cells of the scan. "deterministic" corrects all the
+    orphans of the stratums at once, the result doesn't depend on any scan order (a transposed map gives the
+    transposed result) and it's fully vectorized."""
 
     DIRS_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
                     (0, 1), (1, -1), (1, 0), (1, 1)]
@@ -30,6 +40,7 @@ class Stratums():
 
     def __init__(self, parameters: object, heightmap: object, width: int, height: int):
         self._parameters = parameters
+        self._orphans_mode = getattr(parameters, 'orphans_mode', 'scan')
         self._heightmap = heightmap
         self._width = width
         self._height = height
@@ -39,6 +50,16 @@ class Stratums():
         """Access the stratums property"""
         return self._stratums
 
+    @property
+    def step(self):
+        """Access the height of a stratum"""
+        return self._step
+
+    @property
+    def base(self):
+        """Access the height of the stratum 0"""
+        return self._base
+
     @chrono
     def calculate_stratums(self):
         """Calculate the stratums"""
@@ -50,8 +71,9 @@ class Stratums():
             logging.critical(
                 "A required parameter is missing from the parameters : \n{err}".format(err=e))
         # Init and optimize
-        self._stratums = stratums = numpy.zeros(
-            (self._width, self._height), numpy.float64)
+        self._stratums = numpy.zeros((self._width, self._height), numpy.uint8)
+        self._step = self._base = 0.0
+        stratums = numpy.zeros((self._width, self._height), numpy.float64)
         heightmap = self._heightmap
         step = (numpy.amax(heightmap) - numpy.amin(heightmap)) / \
             float(step_count)
@@ -62,64 +84,105 @@ class Stratums():
         self._base_calculation(heightmap, stratums, step)
         # Correct the broken curves
         self._correct_broken_lines(stratums, step, step_count)
+        # The stratums are multiples of the step, from here they are compared exactly as levels
+        levels = numpy.rint(stratums / step).astype(numpy.int64)
         # Correct orphan pixels
-        self._correct_orphan_pixels(stratums, step)
-        # Store result
-        self._stratums = stratums
+        self._correct_orphan_pixels(levels)
+        # Store result as level indices above the lowest stratum
+        lowest = numpy.amin(levels)
+        levels -= lowest
+        self._step = step
+        self._base = lowest * step
+        dtype = numpy.uint8 if numpy.amax(levels) <= numpy.iinfo(numpy.uint8).max else numpy.uint16
+        self._stratums = levels.astype(dtype)
 
     def _base_calculation(self, heightmap, stratums: object, step: float):
-        for x in range(self._width):
-            for y in range(self._height):
-                # Exceed is the amount of "mater" over the last startum : we want only the height
-                exceed = heightmap[x, y] % step
-                stratums[x, y] = heightmap[x, y] - exceed
+        # Exceed is the amount of "mater" over the last startum : we want only the height
+        numpy.subtract(heightmap, numpy.remainder(heightmap, step), out=stratums)
 
     def _correct_broken_lines(self, stratums, step, step_count):
         # Init and optimize
         highest = numpy.amax(stratums)
-        dirs_offsets = self.DIRS_OFFSETS
-        width = self._width
-        height = self._height
         filter_range = 0.1 * step
+        # A cell lowered by several neighbours keeps the value of the last one in the (x, y) scan order,
+        # the last neighbour of the scan is the one in the first direction
+        directions = [shifted_slices(dir_x, dir_y, self._width, self._height)
+                      for dir_x, dir_y in reversed(self.DIRS_OFFSETS)]
         # We process one stratum at the time because a higher stratum can
         # influence the lowers
         for i in range(step_count + 1):
             # Because we are using float (there aren't a exact science)
             # We need to filter them. It's okay because there is big gaps between stratums
             filter_height = highest - step * i
-            for x in range(width):
-                for y in range(height):
-                    current = stratums[x, y]
-                    # If the current height is the one we are processing
-                    if filter_height - filter_range < current < filter_height + filter_range:
-                        # Check in each direction if there is a big cliff
-                        # We want cliff that are the size of a step
-                        for dir_x, dir_y in dirs_offsets:
-                            nx, ny = x + dir_x, y + dir_y
-                            if 0 <= nx < width and 0 <= ny < height:  # It's in the map
-                                gradient = current - stratums[nx, ny]
-                                if gradient > step:
-                                    stratums[nx, ny] = current - step
-
-    def _correct_orphan_pixels(self, stratums, step):
+            processed = (filter_height - filter_range < stratums) & (stratums < filter_height + filter_range)
+            if not processed.any():
+                continue
+            # Check in each direction if there is a big cliff
+            # We want cliff that are the size of a step
+            for cells, neighbours in directions:
+                current = stratums[cells]
+                neighbour = stratums[neighbours]
+                lowered = processed[cells] & (current - neighbour > step)
+                neighbour[lowered] = current[lowered] - step
+
+    def _correct_orphan_pixels(self, levels):
+        if self._orphans_mode not in ('scan', 'deterministic'):
+            raise ValueError(
+                "Unknown orphans mode '{m}'".format(m=self._orphans_mode))
+        orphans = self._find_orphans(levels)
+        if self._orphans_mode == 'deterministic':
+            # All the orphans are replaced at once by the mean of their neighbours
+            value = numpy.zeros(levels.shape, levels.dtype)
+            for dir_x, dir_y in self.DIRS_4_OFFSETS:
+                cells, neighbours = shifted_slices(dir_x, dir_y, self._width, self._height)
+                value[cells] += levels[neighbours]
+            levels[orphans] = value[orphans] // 4
+            return
+
+        # Scan order: only the orphans and the cells after a corrected one in the scan can change
         dirs_offsets = self.DIRS_4_OFFSETS
         map_width = self._width
         map_height = self._height
-        for x in range(map_width):
-            for y in range(map_height):
-                current = stratums[x, y]
-                orphan = True
-                for dx, dy in dirs_offsets:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < map_width and 0 <= ny < map_height:
-                        if stratums[nx, ny] == current:
-                            orphan = False
-                if orphan:
-                    value = 0
-                    for dx, dy in dirs_offsets:
-                        if 0 <= x + dx < map_width and 0 <= y + dy < map_height:
-                            value += stratums[x + dx, y + dy]
-                    value /= 4
-                    value -= value % step
-                    stratums[x, y] = value
-                
\ No newline at end of file
+        flat_levels = levels.reshape(-1)
+        queue = numpy.flatnonzero(orphans).tolist()  # Sorted, it's a heap
+        queued = set(queue)
+        while queue:
+            index = heapq.heappop(queue)
+            x, y = divmod(index, map_height)
+            current = flat_levels[index]
+            neighbours = [(x + dx) * map_height + y + dy for dx, dy in dirs_offsets
+                          if 0 <= x + dx < map_width and 0 <= y + dy < map_height]
+            orphan = True
+            for neighbour in neighbours:
+                if flat_levels[neighbour] == current:
+                    orphan = False
+            if orphan:
+                value = 0
+                for neighbour in neighbours:
+                    value += flat_levels[neighbour]
+                value //= 4
+                flat_levels[index] = value
+                # The next cells of the scan see the correction
+                if value != current:
+                    for following in (index + 1 if y + 1 < map_height else None,
+                                      index + map_height if x + 1 < map_width else None):
+                        if following is not None and following not in queued:
+                            queued.add(following)
+                            heapq.heappush(queue, following)
+
+    def _find_orphans(self, levels) -> object:
+        """Find the cells that have no 4-neighbour on the same stratum
+        Parameters
+        ==========
+            levels: object
+        numpy 2d array of the stratums levels
+        Returns
+        =======
+            numpy 2d array
+        True for the orphans"""
+
+        not_orphans = numpy.zeros(levels.shape, bool)
+        for dir_x, dir_y in self.DIRS_4_OFFSETS:
+            cells, neighbours = shifted_slices(dir_x, dir_y, self._width, self._height)
+            not_orphans[cells] |= levels[cells] == levels[neighbours]
+        return ~not_orphans
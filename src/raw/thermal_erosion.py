@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import logging
+import math
+
+import numpy
+from src.helpers.chrono import chrono
+from src.helpers.shift import shifted_slices
+
+
+class ThermalErosion():
+    """Class that relax the slopes of the heightmap: material above the talus slides to the lower neighbours.
+    Each iteration is a vectorized transfer between each cell and its 8 neighbours.
+    Parameters
+    ==========
+        parameters: object
+    A SimpleNamespace object with attributes (sea Parameters.parameters)
+        heightmap: object
+    The 2d numpy array to erode, it is modified in place
+        width: int
+    Width of the 2D array
+        height: int
+    Height of the 2D array
+    Parameters.parameters
+    =====================
+        iterations: int
+    Amount of relaxation passes
+        talus: float
+    Maximum stable height difference between two adjacent cells, it's multiplied by sqrt(2) for the diagonals
+        rate: float
+    Fraction of the material above the talus moved per iteration, between 0 and 0.5 to stay stable"""
+
+    DIRS_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                    (0, 1), (1, -1), (1, 0), (1, 1)]
+    # Rows of cells processed together, their work arrays stay in the CPU cache
+    BLOCK_ROWS = 16
+
+    def __init__(self, parameters: object, heightmap: object, width: int, height: int):
+        try:
+            self._heightmap = heightmap
+            self._width = width
+            self._height = height
+            self._iterations = parameters.iterations
+            self._talus = parameters.talus
+            self._rate = parameters.rate
+        except AttributeError as e:
+            logging.critical(
+                "A required parameter is missing from the parameters : \n{err}".format(err=e))
+
+    @property
+    def heightmap(self):
+        """Access the heightmap property"""
+        return self._heightmap
+
+    @chrono
+    def erode(self):
+        """Move the material above the talus to the lower neighbours, proportionally to their excess of slope.
+        The map is processed by blocks of rows: the excesses of slope of a block are calculated once per
+        iteration and reused to distribute the material. The work arrays, including a copy of the heights, are
+        float32, only the heightmap itself stays in float64"""
+
+        # Init and optimize
+        heightmap = self._heightmap
+        rate = self._rate
+        rows = min(self.BLOCK_ROWS, self._width)
+        block_shape = (rows, self._height)
+        excesses = [numpy.empty(block_shape, numpy.float32) for _ in self.DIRS_OFFSETS]
+        total = numpy.empty(block_shape, numpy.float32)
+        highest = numpy.empty(block_shape, numpy.float32)
+        moved = numpy.empty(block_shape, numpy.float32)
+        transfer = numpy.empty(block_shape, numpy.float32)
+        delta = numpy.empty((self._width, self._height), numpy.float32)
+        work = numpy.empty((self._width, self._height), numpy.float32)
+        blocks = [self._block_directions(first, min(first + rows, self._width))
+                  for first in range(0, self._width, rows)]
+
+        for _iteration in range(self._iterations):
+            # The heights of the whole map are updated at the end of the iteration
+            delta.fill(0)
+            work[:] = heightmap
+            for directions in blocks:
+                # Total and highest excess of slope of each cell of the block
+                total.fill(0)
+                highest.fill(0)
+                for (cells, source, neighbour, talus), excess in zip(directions, excesses):
+                    excess = excess[cells]
+                    self._excess(work, source, neighbour, talus, excess)
+                    total[cells] += excess
+                    numpy.maximum(highest[cells], excess, out=highest[cells])
+                # Fraction of the excess moved
+                moved.fill(0)
+                numpy.divide(highest, total, out=moved, where=total > 0)
+                moved *= rate
+                # Move the material to the lower neighbours, the cell loses what they receive
+                for (cells, source, neighbour, _talus), excess in zip(directions, excesses):
+                    numpy.multiply(excess[cells], moved[cells], out=transfer[cells])
+                    delta[neighbour] += transfer[cells]
+                    delta[source] -= transfer[cells]
+            heightmap += delta
+
+    def _block_directions(self, first: int, last: int) -> list:
+        """Create the slices of each direction for a block of rows
+        Parameters
+        ==========
+            first: int
+        First row of the block
+            last: int
+        Row after the last row of the block
+        Returns
+        =======
+            list of tuples (cells, source, neighbour, talus)
+        The slices of the cells of the block that have a neighbour in the direction, in the block work arrays
+        and in the map, the slices of these neighbours in the map and the talus of the direction"""
+
+        directions = []
+        for dx, dy in self.DIRS_OFFSETS:
+            (source_x, source_y), (_neighbour_x, neighbour_y) = shifted_slices(dx, dy, self._width, self._height)
+            start, stop = max(source_x.start, first), min(source_x.stop, last)
+            directions.append(((slice(start - first, stop - first), source_y),
+                               (slice(start, stop), source_y),
+                               (slice(start + dx, stop + dx), neighbour_y),
+                               self._talus * math.hypot(dx, dy)))
+        return directions
+
+    def _excess(self, heightmap: object, source: tuple, neighbour: tuple, talus: float, out: object):
+        """Calculate the excess of slope above the talus from each cell to the neighbour in one direction
+        Parameters
+        ==========
+            heightmap: object
+        numpy 2d array of the heights
+            source: tuple
+        Slices of the cells that have a neighbour in this direction
+            neighbour: tuple
+        Slices of these neighbours
+            talus: float
+        Talus in this direction
+            out: object
+        numpy 2d array of the shape of the source cells where the result is stored, 0 where the slope is below
+        the talus"""
+
+        numpy.subtract(heightmap[source], heightmap[neighbour], out=out, casting='same_kind')
+        out -= talus
+        numpy.maximum(out, 0, out=out)
@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 # coding: utf-8
 
+import heapq
 import logging
 import random
 
@@ -8,10 +9,41 @@ import numpy
 from src.raw.rawmap import RawMap
 from src.helpers.chrono import chrono
 from src.raw.cliffs import Cliffs
+from src.raw.hydrology import Hydrology
 import functools
 
 
 class Waters():
+    """Class that generate the rivers and the pools of the map
+    Parameters
+    ==========
+        parameters: object
+    A SimpleNamespace object with attributes (sea Parameters.parameters)
+        rawmap: RawMap
+    The map with its heightmap and its cliffs
+        map_width: int
+    Width of the map
+        map_height: int
+    Height of the map
+        seed: int
+    The randomness seed
+    Parameters.parameters
+    =====================
+        engine: str
+    Optional, "search" (default) follows each river with a search of the lowest path from its source.
+    "flow" calculates the flow directions of the whole map once, the rivers of all the sources are
+    accumulated downstream together, so the cost doesn't depend on the amount of sources
+        river_lifetime: int
+    Maximum amount of pools a river crosses
+    The other parameters are sea_level, pooling (max_depth, basin_trim) and sources (amount, distance,
+    power_range, x_range, y_range, height_range). pooling.layer_size is deprecated : the pools aren't filled
+    layer by layer anymore but up to the spill height of their basin, it is ignored with a warning
+    River search
+    ============
+    A river search that doesn't reach the sea ends on the lowest cell it closed that is not a cliff, where the
+    river floods a pool. The cells of a pool can't end a search: the search jumps to the drain of the pool
+    and only the cell after the drain counts as the lowest, so the river continues from the drain instead of
+    stopping in the pool it already filled"""
 
     DIR_4_OFFSETS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
 
@@ -29,6 +61,7 @@ class Waters():
         try:
             self._rawmap = rawmap
             self._prng = random.Random(seed)
+            self._engine = getattr(parameters, 'engine', 'search')
             self._river_lifetime = parameters.river_lifetime
             self._sea_level = parameters.sea_level
             sources = parameters.sources
@@ -39,9 +72,11 @@ class Waters():
             self._sources_y_range = sources.y_range
             self._sources_height_range = sources.height_range
             pooling = parameters.pooling
-            self._pooling_layer_size = pooling.layer_size
             self._pooling_max_depth = pooling.max_depth
             self._basin_trim = pooling.basin_trim
+            if hasattr(pooling, 'layer_size'):
+                logging.warning("The pooling.layer_size parameter is deprecated and ignored, the pools are "
+                                "filled up to the spill height of their basin.")
         except AttributeError as e:
             logging.critical(
                 "A required parameter is missing from the parameters : \n{err}".format(err=e))
@@ -56,6 +91,11 @@ class Waters():
             self._sources_height_range = [lowest + v * delta_height for v in self._sources_height_range]
             self._sea_level = lowest + self._sea_level * delta_height
             self._basin_trim = lowest + self._basin_trim * delta_height
+            # River search arrays, flat indices, reused by each search
+            self._river_search = 0
+            self._river_tried = numpy.zeros(map_width * map_height, numpy.int32)
+            self._river_closed = numpy.zeros(map_width * map_height, numpy.int32)
+            self._river_parents = numpy.full(map_width * map_height, -1, numpy.int32)
 
     @chrono
     def generate(self):
@@ -67,16 +107,21 @@ class Waters():
         poolmap = numpy.zeros((map_width, map_height))
 
         # Initialize work variables
-        sources = []  # Sources coordinates
-        drainsmap = numpy.full((map_width, map_height), None) # None if no drain, (drain x, drain y) if there is one
+        drainsmap = numpy.full((map_width, map_height), -1, numpy.int32) # -1 if no drain, flat index of the drain (x * map_height + y) if there is one
+        self._find_basins()
+        sources, powers = self._find_sources()
 
         # Generate the rivers and pools on a raw heightmap
-        for _ in range(self._sources_amount):
-            # Find a valid source
-            source, source_power = self._find_source(sources)
-            sources.append(source)
-            # Simulate the river from this source
-            rivermap, poolmap, drainsmap = self._simulate_river(source, source_power, rivermap, poolmap, drainsmap)
+        if self._engine == 'search':
+            for source, source_power in zip(sources, powers):
+                # Simulate the river from this source
+                rivermap, poolmap, drainsmap = self._simulate_river(source, source_power, rivermap, poolmap, drainsmap)
+        elif self._engine == 'flow':
+            # Flow the rivers of all the sources
+            rivermap, poolmap, drainsmap = self._flow_rivers(sources, powers, rivermap, poolmap, drainsmap)
+        else:
+            raise ValueError(
+                "Unknown waters engine '{e}'".format(e=self._engine))
 
         # Draw the final rivers
         # SKIPPED -> The result isn't good enough
@@ -89,54 +134,68 @@ class Waters():
         self._rivermap = rivermap
         self._poolmap = poolmap
 
-    def _find_source(self, sources: list[tuple[int, int]]) -> list[tuple[int, int], float]:
+    @chrono
+    def _find_sources(self) -> list[list[tuple[int, int]], list[float]]:
+        """Pick the sources among the valid cells with a Poisson-disk sampling : the candidates are tried in a
+        random order and a candidate is kept if no kept source is closer than the sources distance. The kept
+        sources are stored in a grid of distance x distance buckets, so a candidate is only compared to the
+        sources of the 3 x 3 buckets around it
+        Returns
+        =======
+            list, list
+        The coordinates of the sources and their powers. There are less sources than the sources amount if the
+        valid cells are all used"""
+
         # Retrieve working variables
         map_width, map_height = self._map_width, self._map_height
         heightmap = self._rawmap.heightmap
-        cliffmap = self._rawmap.cliffs
-        range_x = self._sources_x_range
-        range_y = self._sources_y_range
+        amount = self._sources_amount
+        distance = self._sources_distance
+        dst_min = distance * distance
+        power_min, power_max = self._sources_power_range
+        prng = numpy.random.default_rng(self._prng.getrandbits(64))
+
+        # Valid cells : in the spawn ranges (bounds included), the height range and not on a cliff
+        min_x, max_x = max(self._sources_x_range[0], 0), min(self._sources_x_range[1], map_width - 1)
+        min_y, max_y = max(self._sources_y_range[0], 0), min(self._sources_y_range[1], map_height - 1)
         height_min, height_max = self._sources_height_range
-        randint = self._prng.randint
-        dst_min = self._sources_distance * self._sources_distance
-        dst_diag = map_width * map_width + map_height * map_height
-        power_range = self._sources_power_range
-
-        # Init
-        x, y = None, None
-        source_power = power_range[0] + self._prng.random() * (power_range[1] - power_range[0])
-
-        # Main loop
-        # Search random coordinates that are valid or take the last one
-        for _ in range(100):  # Max attempt
-            # Pick a random cooridnate in the spawn range
-            x, y = randint(*range_x), randint(*range_y)
-            # Check height
-            if not(height_min <= heightmap[x, y] <= height_max):
-                continue
-            # Check cliff
-            if cliffmap[x, y] != 0:
-                continue
-            # Check distance from other source
-            current_min_dst = dst_diag
-            for other_x, other_y in sources:
-                sqr_dst = (x - other_x) * (x - other_x) + (y - other_y) * (y - other_y) 
-                if sqr_dst < current_min_dst:
-                    current_min_dst = sqr_dst
-            if current_min_dst < dst_min:
-                continue
-            # Return valid coordinate
-            return (x, y), source_power
+        valid = numpy.zeros((map_width, map_height), bool)
+        area = (slice(min_x, max_x + 1), slice(min_y, max_y + 1))
+        heights = heightmap[area]
+        valid[area] = (height_min <= heights) & (heights <= height_max) & (self._rawmap.cliffs[area] == 0)
+        candidates = prng.permutation(numpy.flatnonzero(valid))
+
+        # Poisson-disk sampling of the candidates
+        sources = []
+        if distance <= 0:
+            sources = [divmod(int(index), map_height) for index in candidates[:amount]]
+        else:
+            buckets = {}
+            for index in candidates.tolist():
+                x, y = divmod(index, map_height)
+                bucket_x, bucket_y = int(x // distance), int(y // distance)
+                if any((x - other_x) * (x - other_x) + (y - other_y) * (y - other_y) < dst_min
+                       for near_x in (bucket_x - 1, bucket_x, bucket_x + 1)
+                       for near_y in (bucket_y - 1, bucket_y, bucket_y + 1)
+                       for other_x, other_y in buckets.get((near_x, near_y), ())):
+                    continue
+                sources.append((x, y))
+                buckets.setdefault((bucket_x, bucket_y), []).append((x, y))
+                if len(sources) == amount:
+                    break
+        if len(sources) < amount:
+            logging.debug("Only {n} valid sources have been found out of {a}.".format(n=len(sources), a=amount))
 
-        # Return the last coordinates tested
-        logging.debug("No valid source have been fined.")
-        return (x, y), source_power
+        # Powers
+        powers = (power_min + prng.random(len(sources)) * (power_max - power_min)).tolist()
+        return sources, powers
 
     def _simulate_river(self, source: tuple[int, int], source_power: float, rivermap: numpy.array, poolmap: numpy.array, drainsmap: numpy.array) -> list[numpy.array, numpy.array, numpy.array]:
         # Optimize function calling
         sea_level = self._sea_level
         heightmap = self._rawmap.heightmap
         lifetime = self._river_lifetime
+        map_height = self._map_height
         flood = self._flood
         find_river = self._find_river
         draw_line_river = self._draw_line_river
@@ -156,12 +215,12 @@ class Waters():
             # Thin river
             draw_line_river(rivermap, river, source_power)
             # Update the river head position
-            x, y = drainsmap[x, y] if drainsmap[x, y] is not None else river[-1]
+            x, y = divmod(int(drainsmap[x, y]), map_height) if drainsmap[x, y] != -1 else river[-1]
             # Filling the basin
             poolmap, drainsmap, too_deep_pool = flood(x, y, poolmap, drainsmap)
             # Update position if not too deep
             if not too_deep_pool:
-                x, y = drainsmap[x, y]
+                x, y = divmod(int(drainsmap[x, y]), map_height)
         # Debug
         if life >= lifetime:
             logging.debug("A river doesn't reach the sea from {s}".format(s=source))
@@ -171,168 +230,280 @@ class Waters():
         # Return the result
         return rivermap, poolmap, drainsmap
 
-    def _flood(self, x: int, y: int, poolmap: numpy.array, drainsmap: numpy.array) -> list[numpy.array, numpy.array, bool]:
-        # > Retrieve working variables
+    @chrono
+    def _flow_rivers(self, sources: list[tuple[int, int]], powers: list[float], rivermap: numpy.array, poolmap: numpy.array, drainsmap: numpy.array) -> list[numpy.array, numpy.array, numpy.array]:
+        """Flow the water of all the sources downstream at once. The water stops in the sinks of the flow
+        directions, each sink reached is flooded : the water of the pool flows to its drain, and the flow is
+        accumulated again until no new sink is reached. The river strength of a cell is the sum of the powers
+        of the sources upstream
+        Parameters
+        ==========
+            sources: list
+        The (x, y) coordinates of the sources
+            powers: list
+        The power of each source
+            rivermap, poolmap, drainsmap: numpy.array
+        The maps of the water stage
+        Returns
+        =======
+            list[numpy.array, numpy.array, numpy.array]
+        The rivermap, the poolmap and the drainsmap"""
+
+        # Retrieve working variables
         map_width, map_height = self._map_width, self._map_height
-        heightmap =self._rawmap.heightmap
-        cliffmap = self._rawmap.cliffs
-        layer_size = self._pooling_layer_size
-        max_depth = self._pooling_max_depth
-        sea_level = self._sea_level
-        dirs = self.DIR_4_OFFSETS
+        heights = self._rawmap.heightmap.reshape(-1)
+        drains = drainsmap.reshape(-1)
+
+        # Flow directions of the map
+        hydrology = Hydrology(self._rawmap.heightmap, self._rawmap.cliffs, map_width, map_height, self._sea_level)
+        hydrology.calculate_directions()
+        directions = hydrology.receivers.copy()
+
+        # Init variables
+        weights = numpy.zeros(map_width * map_height)
+        numpy.add.at(weights, [x * map_height + y for x, y in sources], powers)
+        sea = heights <= self._sea_level
+        flooded = numpy.zeros(map_width * map_height, bool)
+        self._trim_sinks(directions)
+        receivers = directions
 
-        # > Init variables
-        # Condition
-        too_deep = False
-        drain_found = False
-        # Layer management
-        layer = []
-        top_plane = bottom_plane = heightmap[x, y] + poolmap[x, y]
-        tried = numpy.full((map_width, map_height), False, numpy.bool8)
-        # Positions
-        i_pos_x, i_pos_y = x, y
-        drain_x = drain_y = None
+        # Main loop
+        # Until no new sink is reached or max lifetime reached
+        for _ in range(self._river_lifetime):
+            flow = hydrology.accumulate(weights, receivers)
+            sinks = numpy.flatnonzero((receivers == -1) & (flow.reshape(-1) > 0) & ~sea & ~flooded)
+            if sinks.size == 0:
+                break
+            # Filling the basins
+            for sink in sinks.tolist():
+                flooded[sink] = True
+                poolmap, drainsmap, _too_deep = self._flood(*divmod(sink, map_height), poolmap, drainsmap)
+            # The water of the pools flows to their drain
+            receivers = numpy.where(drains != -1, drains, directions)
+        else:
+            logging.debug("The rivers don't reach the sea after {l} pools".format(l=self._river_lifetime))
+            flow = hydrology.accumulate(weights, receivers)
+
+        # Return the result
+        rivermap += flow
+        return rivermap, poolmap, drainsmap
+
+    def _trim_sinks(self, receivers: numpy.array):
+        """Reroute the sinks of the flow directions that don't need a pool to their drain : the flat areas
+        next to the sea and the basins shallower than basin_trim, the rivers climb out of them as they do
+        in the search engine. Two sibling basins spill into each other, only the one with the highest bottom
+        is rerouted, the other one is the bottom of their merged basin
+        Parameters
+        ==========
+            receivers: numpy.array
+        The flat array of the receivers, modified in place"""
+
+        # Retrieve working variables
+        heights = self._rawmap.heightmap.reshape(-1)
+        parents, siblings = self._basin_parents, self._basin_siblings
+        spills, bottoms, drains = self._basin_spills, self._basin_bottoms, self._basin_drains
 
         # Main loop
-        # Until max depth reached or drain found
-        while not drain_found and not too_deep:
-            # Prepare the current layer
-            bottom_plane = top_plane
-            top_plane += layer_size
-            layer.clear()
-            tried.fill(False)
-            # Find the layer points from the origin
-            opened_x = [i_pos_x]
-            opened_y = [i_pos_y]
-            tried[i_pos_x, i_pos_y] = True
-
-            # Until there is no potential layer point left
-            while len(opened_x) > 0:
-                # Retrieve current point and add it to the layer
-                x = opened_x.pop()
-                y = opened_y.pop()
-                layer.append((x, y))
-                # Test all the neighbour to if :
-                # - One is the drain
-                # - There are pool part
-                for dx, dy in dirs:
-                    nx, ny = x + dx, y + dy
-                    # Out of the map
-                    if not(0 <= nx < map_width and 0 <= ny < map_height):
-                        continue
-                    # Tried already
-                    if tried[nx, ny]:
-                        continue
-                    tried[nx, ny] = True
-                    # Cliff are not poolable
-                    if cliffmap[nx, ny] != 0:
-                        continue
-                    # It's a drain point or sea
-                    if heightmap[nx, ny] + poolmap[nx, ny] < bottom_plane or heightmap[nx, ny] <= sea_level:
-                        # No drain to far -> just set the drain
-                        # New drain -> check if this is a lower drain
-                        if not drain_found or heightmap[drain_x, drain_y] > heightmap[nx, ny]:
-                            drain_x, drain_y = nx, ny
-                        # However, the drain is found
-                        drain_found = True
-                    # It's a pool part if it's neither drain, wall or cliff
-                    elif heightmap[nx, ny] < top_plane: #  and cliffmap[nx, ny] == 0:
-                        opened_x.append(nx)
-                        opened_y.append(ny)
-
-            # Fill the layer
-            for x, y in layer:
-                poolmap[x, y] = top_plane - heightmap[x, y]
-                # Check depth of the pool, if it's to deep : quit
-                # This avoid the map to fill up completly
-                if poolmap[x, y] > max_depth:
-                    too_deep = True
-
-            # Drain found -> Setup the drain teleportation
-            if drain_found:
-                # logging.debug("Drain found {s}".format(s = (drain_x ,drain_y, heightmap[drain_x, drain_y])))
-                # Drain found
-                # Fill the layer with drain's height and set the drain map
-                drain = (drain_x, drain_y)
-                for x, y in layer:
-                    drainsmap[x, y] = drain
+        sinks = numpy.flatnonzero((receivers == -1) & (heights > self._sea_level) & (self._basin_of != -1))
+        for sink in sinks.tolist():
+            basin = int(self._basin_of[sink])
+            # Flat area, it reaches the sea without climbing
+            if basin == 0:
+                receivers[sink] = self._downstream[sink]
+                continue
+            # Go up to the basin the sink is the bottom of
+            while parents[basin] > 0 and (bottoms[basin], basin) < (bottoms[siblings[basin]], siblings[basin]):
+                basin = parents[basin]
+            if parents[basin] != -1 and spills[basin] - bottoms[basin] < self._basin_trim:
+                # The water crosses the basin as if it was full
+                receivers[sink] = drains[basin]
+                self._basin_full[basin] = True
 
-        # Return the results
-        return poolmap, drainsmap, too_deep
+    @chrono
+    def _find_basins(self):
+        """Build the hierarchy of the depressions in a single sweep of the cells sorted by height.
+        A basin starts at a local minimum and grows with the cells that reach it without climbing. The cliffs
+        are walls, except the vertical ones the water can cross : they connect the basins but the water
+        can't pool on them. When a cell touches several basins, it's their saddle :
+        each basin spills there into the other one, they are merged into a new basin made of both. A basin
+        that touches the sea spills into it. Each basin knows its spill height, its drain (the lowest cell
+        of the other basin next to the saddle), its bottom and its cells."""
 
-    def _find_river(self, i_x: int, i_y: int, drainsmap: numpy.array):
-        def node_normal(x, y, found_target, target, nodes, tried, dirs, map_width, map_height, heightmap):
-            # Test each neighbours
+        # Retrieve working variables
+        map_width, map_height = self._map_width, self._map_height
+        heightmap = self._rawmap.heightmap
+        sea_level = self._sea_level
+        heights = heightmap.reshape(-1).tolist()
+        # The vertical cliffs connect the basins, the water can't pool on them
+        passable = ((self._rawmap.cliffs == 0) | (Hydrology.vertical_cliffs(self._rawmap.cliffs) != 0)).reshape(-1).tolist()
+        order = numpy.argsort(heightmap, axis=None, kind='stable').tolist()
+        dirs = self.DIR_4_OFFSETS
+
+        # Init variables
+        # Basin 0 is the sea
+        basin_of = [-1] * (map_width * map_height)  # Smallest basin of each cell, -1 for the other cliffs
+        downstream = [-1] * (map_width * map_height)  # Lowest neighbour reached by each cell
+        parents, siblings, children = [-1], [-1], [(-1, -1)]
+        spills, bottoms, drains = [float('inf')], [float('-inf')], [-1]
+        merged = [0]  # Union find of the basins to their current biggest basin
+
+        def find(basin):
+            root = basin
+            while merged[root] != root:
+                root = merged[root]
+            while merged[basin] != root:
+                merged[basin], basin = root, merged[basin]
+            return root
+
+        # Main loop
+        for cell in order:
+            if not passable[cell]:
+                continue
+            x, y = divmod(cell, map_height)
+            # Lowest neighbour of each basin around the cell
+            lowests = {}
             for dx, dy in dirs:
-                # Neighbour coordinates
                 nx, ny = x + dx, y + dy
-                # Out of the map
                 if not(0 <= nx < map_width and 0 <= ny < map_height):
                     continue
-                # Already tried
-                if tried[nx, ny]:
-                    continue
-                tried[nx, ny] = True
-                # Sea -> End of the river
-                if heightmap[nx, ny] <= sea_level:
-                    # logging.debug("A river has reached the sea")
-                    found_target = True
-                    target = (nx, ny, x, y)
-                    break
-                # Wall (water can't flow upward)
-                elif heightmap[nx, ny] - heightmap[x, y] >= basin_trim:
+                neighbour = nx * map_height + ny
+                if basin_of[neighbour] == -1:
                     continue
-                # Water can flow
-                else:
-                    point = (nx, ny, x, y)
-                    nodes.append(point)
-            # Return the results
-            return found_target, target
-
-        def node_cliff(x, y, found_target, target):
-            # Type of cliff
-            cliff_vector = Cliffs.dir_vector(cliffmap[x, y])
-            # Unknown cliff
-            if cliff_vector is None:
-                pass # Water can't flow through that
-
-            # Angle cliff
-            elif cliff_vector[0] != 0 and cliff_vector[1] != 0:
-                pass # Water can't flow through that
-
-            # Vertical cliff
-            elif cliff_vector[0] == 0 and cliff_vector[1] != 0:
-                nx, ny = x, y + cliff_vector[1]
-                # Out of the map
-                if not(0 <= nx < map_width and 0 <= ny < map_height):
-                    return found_target, target
-                # Already tried
-                if tried[nx, ny]:
-                    return found_target, target
-                tried[nx, ny] = True
-                # Sea -> End of the river
-                if heightmap[nx, ny] <= sea_level:
-                    # logging.debug("A river has reached the sea")
-                    found_target = True
-                    target = (nx, ny, x, y)
-                    return found_target, target
-                # Wall (water can't flow upward)
-                elif heightmap[nx, ny] - heightmap[x, y] >= basin_trim:
-                    return found_target, target
-                # Water can flow
+                root = find(basin_of[neighbour])
+                if root not in lowests or heights[neighbour] < heights[lowests[root]]:
+                    lowests[root] = neighbour
+            if lowests:
+                downstream[cell] = min(lowests.values(), key=heights.__getitem__)
+            # Sea
+            if heights[cell] <= sea_level:
+                for root in lowests:
+                    merged[root] = 0
+                basin_of[cell] = 0
+                continue
+            # Local minimum -> new basin
+            if not lowests:
+                basin_of[cell] = len(parents)
+                merged.append(len(parents))
+                parents.append(-1)
+                siblings.append(-1)
+                children.append((-1, -1))
+                spills.append(float('inf'))
+                bottoms.append(heights[cell])
+                drains.append(-1)
+                continue
+            # Saddle -> merge the basins
+            roots = list(lowests)
+            current = roots[0]
+            for other in roots[1:]:
+                spills[current] = spills[other] = heights[cell]
+                drains[current], drains[other] = lowests[other], lowests[current]
+                lowest = min(lowests[current], lowests[other], key=heights.__getitem__)
+                if current == 0 or other == 0:
+                    # The sea is never filled
+                    basin = other if current == 0 else current
+                    parents[basin] = siblings[basin] = 0
+                    merged[basin] = current = 0
                 else:
-                    point = (nx, ny, x, y)
-                    nodes.append(point)
+                    # Merged basin
+                    merged_basin = len(parents)
+                    merged.append(merged_basin)
+                    parents.append(-1)
+                    siblings.append(-1)
+                    children.append((current, other))
+                    spills.append(float('inf'))
+                    bottoms.append(min(bottoms[current], bottoms[other]))
+                    drains.append(-1)
+                    parents[current] = parents[other] = merged_basin
+                    siblings[current], siblings[other] = other, current
+                    merged[current] = merged[other] = current = merged_basin
+                lowests[current] = lowest
+            basin_of[cell] = current
+
+        # Store the hierarchy
+        self._basin_of = numpy.array(basin_of, numpy.int32)
+        self._downstream = numpy.array(downstream, numpy.int32)
+        self._basin_parents = parents
+        self._basin_siblings = siblings
+        self._basin_children = children
+        self._basin_spills = spills
+        self._basin_bottoms = bottoms
+        self._basin_drains = drains
+        self._basin_full = [False] * len(parents)
+        # Cells of each basin, without the cells of its children
+        self._basin_order = numpy.argsort(self._basin_of, kind='stable')
+        self._basin_starts = numpy.searchsorted(self._basin_of[self._basin_order], numpy.arange(len(parents) + 1))
+
+    def _basin_cells(self, basin: int) -> numpy.array:
+        """Flat indices of the cells of a basin and of its children
+        Parameters
+        ==========
+            basin: int
+        Index of the basin
+        Returns
+        =======
+            numpy.array"""
+
+        opened = [basin]
+        cells = []
+        while opened:
+            basin = opened.pop()
+            cells.append(self._basin_order[self._basin_starts[basin]:self._basin_starts[basin + 1]])
+            opened.extend(child for child in self._basin_children[basin] if child != -1)
+        return numpy.concatenate(cells)
 
-            # Lateral cliff
-            elif cliff_vector[0] != 0 and cliff_vector[1] == 0:
-                # TODO Sideway waterfall tiles
-                # When the tiles are created we will know how they works exaclty
-                # and what space do they need
-                pass
-            
-            return found_target, target
+    def _flood(self, x: int, y: int, poolmap: numpy.array, drainsmap: numpy.array) -> list[numpy.array, numpy.array, bool]:
+        # > Retrieve working variables
+        map_height = self._map_height
+        heights = self._rawmap.heightmap.reshape(-1)
+        flat_poolmap = poolmap.reshape(-1)
+        flat_drainsmap = drainsmap.reshape(-1)
+        cliffs = self._rawmap.cliffs.reshape(-1)
+        max_depth = self._pooling_max_depth
+        full = self._basin_full
+        index = x * map_height + y
+        basin = self._basin_of[index]
+
+        # Cliff are not poolable
+        if basin == -1:
+            return poolmap, drainsmap, True
+        # The water flows down to the sea
+        if basin == 0:
+            downstream = self._downstream[index]
+            drainsmap[x, y] = downstream if downstream != -1 else index
+            return poolmap, drainsmap, False
+
+        # Main loop
+        # Fill the basins until one spills into a basin that isn't full or is too deep
+        while True:
+            # A full basin drains into its sibling, both full are filled together
+            if full[basin]:
+                sibling = self._basin_siblings[basin]
+                if sibling == 0 or not full[sibling]:
+                    break
+                basin = self._basin_parents[basin]
+                continue
+            # Fill the basin up to its spill height, check the depth of the pool
+            # This avoid the map to fill up completly
+            level = self._basin_spills[basin]
+            too_deep = level - self._basin_bottoms[basin] > max_depth
+            if too_deep:
+                level = self._basin_bottoms[basin] + max_depth
+            cells = self._basin_cells(basin)
+            cells = cells[(heights[cells] < level) & (cliffs[cells] == 0)]
+            flat_poolmap[cells] = level - heights[cells]
+            if too_deep:
+                # The pool has no drain, even the full basins it's made of
+                flat_drainsmap[cells] = -1
+                return poolmap, drainsmap, True
+            # Setup the drain teleportation
+            flat_drainsmap[cells] = self._basin_drains[basin]
+            full[basin] = True
 
+        # Return the results
+        drainsmap[x, y] = self._basin_drains[basin]
+        return poolmap, drainsmap, False
+
+    def _find_river(self, i_x: int, i_y: int, drainsmap: numpy.array):
         # Retrieve working variables
         map_width, map_height = self._map_width, self._map_height
         dirs = self.DIR_4_OFFSETS
@@ -340,53 +511,92 @@ class Waters():
         cliffmap = self._rawmap.cliffs
         sea_level = self._sea_level
         basin_trim = self._basin_trim
+        dir_vector = Cliffs.dir_vector
+        heappush, heappop = heapq.heappush, heapq.heappop
 
         # Init variables
-        nodes = [(i_x, i_y, None, None)] # x, y, previous x, previous y
-        tried = numpy.full((map_width, map_height), False, numpy.bool8)
-        tried[i_x, i_y] = True
-        closed = []
+        # The search arrays are shared by all the searches, a cell is tried or closed by the current search
+        # if its value is the search id
+        self._river_search += 1
+        search = self._river_search
+        tried = self._river_tried
+        closed = self._river_closed
+        parents = self._river_parents
+        # Heap of (height, order, x, y, previous flat index), the order keeps the first lowest node first
+        nodes = [(heightmap[i_x, i_y], 0, i_x, i_y, -1)]
+        order = 1
+        tried[i_x * map_height + i_y] = search
         found_target = False
         target = None
-        
-        # Main loop : 
+        lowest = None  # Lowest closed node that is not on a cliff : height, x, y, previous flat index
+
+        # Main loop :
         # Optimized djikstra pathfinding
         while not found_target and len(nodes) > 0:
             # Set the current to the lowest node
-            x, y, px, py = current = min(nodes, key=lambda p: heightmap[p[0], p[1]])
-            nodes.remove(current)
-            closed.append(current)
-            # Change coordinates if there is a drain
-            if drainsmap[x, y] is not None:
-                # logging.debug("A river join a pool")
-                x, y = drainsmap[x, y]
-                current = (x, y, px, py)
-                closed.append(current)
-            # Test the node
+            _, _, x, y, previous = heappop(nodes)
+            # Close the node, the backtrack follows the first closing of a cell
+            drain = drainsmap[x, y]
+            for x, y in ((x, y), divmod(int(drain), map_height)) if drain != -1 else ((x, y),):
+                index = x * map_height + y
+                if closed[index] != search:
+                    closed[index] = search
+                    parents[index] = previous
+            # Change coordinates if there is a drain (done by the loop)
+            # The lowest node can't be a pool, its water goes to the drain
+            if cliffmap[x, y] == 0 and (lowest is None or heightmap[x, y] < lowest[0]):
+                lowest = (heightmap[x, y], x, y, previous)
+            # Find the neighbours
             if cliffmap[x, y] != 0:
                 # Cliff node
-                found_target, target = node_cliff(x, y, found_target, target)
+                cliff_vector = dir_vector(cliffmap[x, y])
+                # Water can only flow through a vertical cliff
+                # TODO Sideway waterfall tiles
+                # When the tiles are created we will know how they works exaclty
+                # and what space do they need
+                if cliff_vector is None or cliff_vector[0] != 0 or cliff_vector[1] == 0:
+                    continue
+                neighbours = ((x, y + cliff_vector[1]),)
             else:
                 # Normal node
-                found_target, target = node_normal(x, y, found_target, target, nodes, tried, dirs, map_width, map_height, heightmap)
+                neighbours = [(x + dx, y + dy) for dx, dy in dirs]
+            # Test each neighbours
+            for nx, ny in neighbours:
+                # Out of the map
+                if not(0 <= nx < map_width and 0 <= ny < map_height):
+                    continue
+                # Already tried
+                n_index = nx * map_height + ny
+                if tried[n_index] == search:
+                    continue
+                tried[n_index] = search
+                # Sea -> End of the river
+                if heightmap[nx, ny] <= sea_level:
+                    found_target = True
+                    target = (nx, ny, index)
+                    break
+                # Wall (water can't flow upward)
+                elif heightmap[nx, ny] - heightmap[x, y] >= basin_trim:
+                    continue
+                # Water can flow
+                else:
+                    heappush(nodes, (heightmap[nx, ny], order, nx, ny, index))
+                    order += 1
 
         # Process the results
-        # Target not found : take the lowest point in closed that is not on a cliff
+        # Target not found : take the lowest point closed that is not on a cliff
         if not found_target:
-            potential = list(filter(lambda p: cliffmap[p[0], p[1]] == 0, closed))
-            if len(potential) == 0:
+            if lowest is None:
                 return [(i_x, i_y)]
-            target = min(potential, key=lambda p: heightmap[p[0], p[1]])
-            found_target = True
+            target = lowest[1:]
         # Backtrack the path
-        river = [target[:2]] # Init the last point of the river
-        previous = target[2:4] # Init the backtrace
+        river = [target[:2]]  # Init the last point of the river
+        previous = target[2]  # Init the backtrace
         # Backtrack to the starting point
-        while previous[0] is not None:
-            point = tuple(filter(lambda n: n[0] == previous[0] and n[1] == previous[1], closed))[0]
-            river.append(point[:2])
-            previous = point[2:4]
-        river = list(reversed(river))
+        while previous != -1:
+            river.append(divmod(previous, map_height))
+            previous = int(parents[previous])
+        river.reverse()
 
         # Return the result
         return river
@@ -456,7 +666,7 @@ class Waters():
         map_width, map_height = self._map_width, self._map_height
         stratums = self._rawmap.stratums
         cliffmap = self._rawmap.cliffs
-        lowest = numpy.amin(stratums) - (1 if self._sea_level < numpy.amin(self._rawmap.heightmap) else 0)
+        lowest = int(numpy.amin(stratums)) - (1 if self._sea_level < numpy.amin(self._rawmap.heightmap) else 0)
 
         # Main loop
         for x in range(map_width):
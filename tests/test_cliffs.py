@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import unittest
+
+import numpy
+from src.helpers.resize import resize_data
+from src.raw.cliffs import Cliffs
+
+
+class Test_Cliffs(unittest.TestCase):
+    @staticmethod
+    def reference(stratums: object) -> object:
+        # Per cell implementation of the cliff codes
+        width, height = stratums.shape
+        cliffs = numpy.zeros((width, height), numpy.int64)
+        for x in range(width):
+            for y in range(height):
+                current = 0
+                for dir_x, dir_y in Cliffs.DIRS_OFFSETS:
+                    nx, ny = x + dir_x, y + dir_y
+                    current = current << 1
+                    if 0 <= nx < width and 0 <= ny < height and stratums[nx, ny] < stratums[x, y]:
+                        current |= 1
+                cliffs[x, y] = current
+        return cliffs
+
+    def test_cliffs(self):
+        rng = numpy.random.default_rng(1993)
+        for shape in ((1, 6), (5, 1), (23, 31)):
+            stratums = rng.integers(0, 4, shape).astype(numpy.uint8)
+            cliffs_gen = Cliffs(None, stratums, *shape)
+            cliffs_gen.calculate_cliffs()
+            self.assertEqual(cliffs_gen.cliffs.dtype, numpy.uint8)
+            self.assertTrue(numpy.array_equal(cliffs_gen.cliffs, self.reference(stratums)))
+
+    def test_flatland(self):
+        cliffs_gen = Cliffs(None, numpy.ones((4, 4), numpy.uint8), 4, 4)
+        cliffs_gen.calculate_cliffs()
+        self.assertFalse(numpy.any(cliffs_gen.cliffs))
+
+
+    def test_upscale(self):
+        rng = numpy.random.default_rng(1993)
+        for factor in (2, 3):
+            stratums = rng.integers(0, 3, (17, 12)).astype(numpy.uint8)
+            cliffs_gen = Cliffs(None, stratums, 17, 12)
+            cliffs_gen.calculate_cliffs()
+            # Same as the cliffs of the resized stratums
+            resized, width, height = resize_data(stratums, 17, 12, factor)
+            expected = Cliffs(None, resized, width, height)
+            expected.calculate_cliffs()
+            upscaled = Cliffs.upscale_cliffs(cliffs_gen.cliffs, 17, 12, factor)
+            self.assertTrue(numpy.array_equal(upscaled, expected.cliffs))
+
+
+if __name__ == '__main__':
+    unittest.main()
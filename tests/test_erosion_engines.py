@@ -0,0 +1,260 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy
+from src.helpers.resize import reduce_data, resize_data
+from src.raw.erosion import Erosion
+from src.raw.erosion_types import droplets, pipes
+
+
+class Test_ErosionEngines(unittest.TestCase):
+    PARAMETERS = {
+        "droplets": 2000,
+        "brush_radius": 3,
+        "inertia": 0.05,
+        "sediment_capacity_factor": 4,
+        "sediment_min_capacity": 0.1,
+        "erode_speed": 0.3,
+        "deposit_speed": 0.3,
+        "evaporate_speed": 0.01,
+        "gravity": 4.0,
+        "droplet_lifetime": 30,
+        "initial_water_volume": 1,
+        "initial_speed": 1,
+        "sea_level": 0
+    }
+
+    @staticmethod
+    def heightmap(width: int, height: int) -> object:
+        # A cone centered in the map
+        xs, ys = numpy.indices((width, height))
+        distance = numpy.hypot(xs - width / 2, ys - height / 2)
+        return numpy.maximum(0, 1 - distance / (min(width, height) / 2))
+
+    def erode(self, width: int, height: int, seed: int, checkpoint_path: str = None, **parameters) -> object:
+        heightmap = self.heightmap(width, height)
+        erosion = Erosion(SimpleNamespace(**{**self.PARAMETERS, **parameters}),
+                          heightmap, width, height, seed, checkpoint_path)
+        erosion.init_brushes()
+        erosion.erode()
+        return heightmap
+
+    def test_sequential(self):
+        heightmap = self.erode(40, 30, 1, engine="sequential")
+        self.assertLess(numpy.sum(heightmap), numpy.sum(self.heightmap(40, 30)))
+
+    def test_batched(self):
+        heightmap = self.erode(40, 30, 1, engine="batched", batch_size=256)
+        self.assertEqual(heightmap.shape, (40, 30))
+        self.assertLess(numpy.sum(heightmap), numpy.sum(self.heightmap(40, 30)))
+        # Reproducible for a given seed
+        self.assertTrue(numpy.array_equal(
+            heightmap, self.erode(40, 30, 1, engine="batched", batch_size=256)))
+        self.assertFalse(numpy.array_equal(
+            heightmap, self.erode(40, 30, 2, engine="batched", batch_size=256)))
+
+    def test_batched_height_cap(self):
+        # The droplets eroding the same cell in a step never dig it below 0
+        heightmap = self.erode(40, 30, 1, engine="batched", batch_size=256)
+        self.assertGreaterEqual(heightmap.min(), 0)
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, self.erode, 10, 10, 1, engine="unknown")
+
+    def test_brushes(self):
+        width, height = 12, 9
+        erosion = Erosion(SimpleNamespace(**{**self.PARAMETERS, "brush_radius": 10}),
+                          self.heightmap(width, height), width, height, 1)
+        erosion.init_brushes()
+        template = erosion._brush_template(10)
+        starts = erosion._brushes_starts
+        for x in range(width):
+            for y in range(height):
+                # The brush is the template clipped on the map borders
+                expected = [(ox, oy) for ox, oy, _w in template
+                            if 0 <= x + ox < width and 0 <= y + oy < height]
+                variant = erosion._brush_variant(x, y)
+                points = list(zip(erosion._brushes_ox[starts[variant]:starts[variant + 1]].tolist(),
+                                  erosion._brushes_oy[starts[variant]:starts[variant + 1]].tolist()))
+                self.assertEqual(points, expected)
+                self.assertAlmostEqual(
+                    numpy.sum(erosion._brushes_we[starts[variant]:starts[variant + 1]]), 1)
+
+    def test_parallel(self):
+        parameters = {"engine": "parallel", "workers": 2, "batch_size": 500, "droplet_lifetime": 5}
+        heightmap = self.erode(40, 30, 1, **parameters)
+        self.assertLess(numpy.sum(heightmap), numpy.sum(self.heightmap(40, 30)))
+        # Deterministic for a given seed and number of workers
+        self.assertTrue(numpy.array_equal(heightmap, self.erode(40, 30, 1, **parameters)))
+
+    def test_parallel_strips(self):
+        # A map wide enough for several strips, the halo is 5 + 3 + 2 cells
+        width, height = 130, 20
+        parameters = SimpleNamespace(**{**self.PARAMETERS, "engine": "parallel", "workers": 2, "droplets": 1000,
+                                        "batch_size": 500, "droplet_lifetime": 5})
+        erosion = Erosion(parameters, self.heightmap(width, height), width, height, 1)
+        erosion.init_brushes()
+        bounds = erosion._strip_bounds(2)
+        self.assertGreater(len(bounds) - 1, 1)
+        self.assertGreaterEqual(len(bounds) - 1, 3)
+        erosion.erode()
+        # Same as the sequential simulation of the even strips then the odd strips of each round
+        reference = Erosion(parameters, self.heightmap(width, height), width, height, 1)
+        reference.init_brushes()
+        reference._init_spawn()
+        prng = numpy.random.default_rng(reference._prng.getrandbits(64))
+        for _round in range(2):
+            pos_x, pos_y = reference._spawn_positions(prng, 500)
+            strips = numpy.searchsorted(bounds, pos_x, side='right') - 1
+            order = numpy.concatenate([numpy.flatnonzero(strips == strip) for parity in (0, 1)
+                                       for strip in range(parity, len(bounds) - 1, 2)])
+            reference._simulate_droplets(zip(pos_x[order].tolist(), pos_y[order].tolist()), 500, log=False)
+        self.assertTrue(numpy.array_equal(erosion._heightmap, reference._heightmap))
+
+    def test_pipes(self):
+        parameters = SimpleNamespace(iterations=50, time_step=0.05, rain_rate=0.01, gravity=9.81,
+                                     sediment_capacity_factor=8, min_tilt=0.01, erode_speed=0.3,
+                                     deposit_speed=0.3, evaporate_speed=0.01, sea_level=0)
+        heightmap = pipes.erode(parameters, self.heightmap(40, 30), 40, 30, 1)
+        self.assertEqual(heightmap.shape, (40, 30))
+        self.assertTrue(numpy.all(numpy.isfinite(heightmap)))
+        self.assertFalse(numpy.array_equal(heightmap, self.heightmap(40, 30)))
+        # Reproducible for a given seed
+        self.assertTrue(numpy.array_equal(
+            heightmap, pipes.erode(parameters, self.heightmap(40, 30), 40, 30, 1)))
+        # The lands are not eroded under the sea level
+        parameters.iterations = 300
+        heightmap = pipes.erode(parameters, self.heightmap(40, 30), 40, 30, 1)
+        self.assertGreaterEqual(heightmap.min(), self.heightmap(40, 30).min())
+
+    def test_spawn(self):
+        width, height = 40, 30
+        heightmap = self.heightmap(width, height)
+        for spawn in ("land", "height"):
+            erosion = Erosion(SimpleNamespace(**{**self.PARAMETERS, "spawn": spawn}),
+                              heightmap, width, height, 1)
+            erosion._init_spawn()
+            pos_x, pos_y = erosion._spawn_positions(numpy.random.default_rng(1), 5000)
+            # Only on the land, never on the last row and column
+            self.assertTrue(numpy.all(heightmap[pos_x, pos_y] > 0))
+            self.assertTrue(numpy.all(pos_x < width - 1) and numpy.all(pos_y < height - 1))
+        # The height weighting favors the summit
+        self.assertGreater(numpy.mean(heightmap[pos_x, pos_y]), 0.4)
+        for engine in ("sequential", "batched"):
+            eroded = self.erode(width, height, 1, engine=engine, spawn="land")
+            self.assertLess(numpy.sum(eroded), numpy.sum(heightmap))
+        self.assertRaises(ValueError, self.erode, 10, 10, 1, spawn="unknown")
+
+    def test_checkpoint(self):
+        for engine in ("sequential", "batched"):
+            parameters = {"engine": engine, "batch_size": 200, "checkpoint_interval": 500, "spawn": "land"}
+            expected = self.erode(40, 30, 1, **parameters)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "erosion_checkpoint.bin")
+                # Interrupt the erosion after its first checkpoint
+                save_checkpoint = Erosion._save_checkpoint
+
+                def interrupt(erosion, *args, **kwargs):
+                    save_checkpoint(erosion, *args, **kwargs)
+                    if os.path.exists(path):
+                        raise KeyboardInterrupt()
+                Erosion._save_checkpoint = interrupt
+                try:
+                    self.assertRaises(KeyboardInterrupt, self.erode, 40, 30, 1, path, **parameters)
+                finally:
+                    Erosion._save_checkpoint = save_checkpoint
+                self.assertTrue(os.path.exists(path))
+                # The resumed erosion gives the same result, then removes the checkpoint
+                with self.assertLogs(level='INFO') as logs:
+                    resumed = self.erode(40, 30, 1, path, **parameters)
+                self.assertTrue(any("resumed" in line for line in logs.output))
+                self.assertTrue(numpy.array_equal(expected, resumed))
+                self.assertFalse(os.path.exists(path))
+
+    def test_adaptive(self):
+        width, height = 40, 30
+        parameters = {**self.PARAMETERS, "droplets": 1000, "batch_size": 100, "adaptive": True}
+        for engine in ("sequential", "batched"):
+            # Converged after the first batch
+            erosion = Erosion(SimpleNamespace(**parameters, engine=engine, convergence_threshold=1e9),
+                              self.heightmap(width, height), width, height, 1)
+            erosion.init_brushes()
+            erosion.erode()
+            self.assertEqual(erosion.droplets_used, 100)
+            # Never converged, the droplets are the hard cap
+            erosion = Erosion(SimpleNamespace(**parameters, engine=engine, convergence_threshold=0),
+                              self.heightmap(width, height), width, height, 1)
+            erosion.init_brushes()
+            erosion.erode()
+            self.assertEqual(erosion.droplets_used, 1000)
+            # Time budget spent after the first batch
+            erosion = Erosion(SimpleNamespace(**parameters, engine=engine, convergence_threshold=0, time_budget=1e-9),
+                              self.heightmap(width, height), width, height, 1)
+            erosion.init_brushes()
+            erosion.erode()
+            self.assertEqual(erosion.droplets_used, 100)
+
+    def test_statistics(self):
+        width, height = 40, 30
+        for engine in ("sequential", "batched", "parallel"):
+            heightmap = self.heightmap(width, height)
+            parameters = {**self.PARAMETERS, "droplets": 500, "batch_size": 100, "workers": 2,
+                          "engine": engine, "statistics_maps": True}
+            erosion = Erosion(SimpleNamespace(**parameters), heightmap, width, height, 1)
+            erosion.init_brushes()
+            erosion.erode()
+            statistics = erosion.statistics
+            # Every droplet has a termination reason
+            self.assertEqual(statistics.droplets, 500)
+            self.assertGreater(statistics.terminations['sea'], 0)
+            self.assertLessEqual(statistics.mean_lifetime, self.PARAMETERS["droplet_lifetime"])
+            self.assertGreater(statistics.droplets_per_second, 0)
+            # The masses match the heightmap change and the heat maps
+            change = numpy.sum(heightmap) - numpy.sum(self.heightmap(width, height))
+            self.assertAlmostEqual(statistics.deposited - statistics.eroded, change)
+            self.assertAlmostEqual(numpy.sum(statistics.erosion_map), statistics.eroded)
+            self.assertAlmostEqual(numpy.sum(statistics.deposition_map), statistics.deposited)
+            self.assertTrue(numpy.allclose(statistics.deposition_map - statistics.erosion_map,
+                                           heightmap - self.heightmap(width, height)))
+        with tempfile.TemporaryDirectory() as directory:
+            statistics.save(directory)
+            self.assertTrue(os.path.exists(os.path.join(directory, "erosion_statistics.json")))
+            self.assertTrue(os.path.exists(os.path.join(directory, "erosion_map.png")))
+
+    def test_coarse(self):
+        width, height = 66, 50
+        parameters = SimpleNamespace(**{**self.PARAMETERS, "droplets": 200, "engine": "batched",
+                                        "coarse_factor": 4, "coarse_droplets": 300})
+        heightmap = droplets.erode(parameters, self.heightmap(width, height), width, height, 1)
+        self.assertEqual(heightmap.shape, (width, height))
+        self.assertTrue(numpy.all(numpy.isfinite(heightmap)))
+        # The coarse pass applies the blurred change of an erosion of the reduced heightmap
+        factor = parameters.coarse_factor
+        heightmap = self.heightmap(width, height)
+        droplets._erode_coarse(parameters, heightmap, width, height, 2, factor, None)
+        change = heightmap - self.heightmap(width, height)
+        coarse, coarse_width, coarse_height = reduce_data(self.heightmap(width, height), width, height, factor)
+        original = coarse.copy()
+        coarse_parameters = SimpleNamespace(**{**vars(parameters), "droplets": 300, "brush_radius": 1,
+                                               "droplet_lifetime": self.PARAMETERS["droplet_lifetime"] // factor,
+                                               "statistics_maps": False})
+        erosion = Erosion(coarse_parameters, coarse, coarse_width, coarse_height, 2)
+        erosion.init_brushes()
+        erosion.erode()
+        steps, _, _ = resize_data(coarse - original, coarse_width, coarse_height, factor)
+        steps = numpy.pad(steps, ((0, width - steps.shape[0]), (0, height - steps.shape[1])), mode='edge')
+        self.assertGreater(numpy.max(numpy.abs(steps)), 0)
+        self.assertTrue(numpy.allclose(change, droplets._box_blur(steps, factor)))
+        # The blur removes the steps between the blocks
+        boundaries = numpy.arange(factor, coarse_width * factor, factor)
+        blurred_jumps = numpy.abs(change[boundaries] - change[boundaries - 1])
+        steps_jumps = numpy.abs(steps[boundaries] - steps[boundaries - 1])
+        self.assertLess(numpy.max(blurred_jumps), numpy.max(steps_jumps) / 2)
+        # The blur keeps the flat areas
+        blurred = droplets._box_blur(numpy.ones((9, 7)), 4)
+        self.assertTrue(numpy.allclose(blurred, 1))
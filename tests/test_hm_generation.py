@@ -0,0 +1,51 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import unittest
+from types import SimpleNamespace
+
+import numpy
+from src.helpers.tiles import split_tiles
+from src.raw.hm_generation import island
+
+
+class Test_Island(unittest.TestCase):
+    PARAMETERS = SimpleNamespace(
+        initial_scale=7,
+        octaves=5,
+        persistence=0.5,
+        lacunarity=2,
+        radius_coef=1.3,
+        center_radius_coef=0.15,
+        variation_initial_scale=2,
+        variation_amplitude_coef=0.6,
+        ease_power=1)
+
+    def test_island(self):
+        heightmap = island.generate(self.PARAMETERS, 60, 40, 1993)
+        self.assertEqual(heightmap.shape, (60, 40))
+        self.assertEqual(heightmap.dtype, numpy.float64)
+        self.assertEqual(numpy.amin(heightmap), 0)
+        self.assertEqual(numpy.amax(heightmap), 1)
+        # Corners are in the sea
+        self.assertEqual(heightmap[0, 0], 0)
+        self.assertEqual(heightmap[59, 39], 0)
+        # The center is the average of its neighbours
+        self.assertGreater(heightmap[30, 20], 0)
+
+    def test_seed(self):
+        a = island.generate(self.PARAMETERS, 30, 30, 1)
+        b = island.generate(self.PARAMETERS, 30, 30, 1)
+        c = island.generate(self.PARAMETERS, 30, 30, 2)
+        self.assertTrue(numpy.array_equal(a, b))
+        self.assertFalse(numpy.array_equal(a, c))
+
+    def test_tiles(self):
+        width, height = 45, 32
+        heightmap = numpy.zeros((width, height), numpy.float32)
+        for x_start, x_end, y_start, y_end in split_tiles(width, height, 16):
+            heightmap[x_start:x_end, y_start:y_end] = island.generate_tile(
+                self.PARAMETERS, width, height, 7, (x_start, x_end, y_start, y_end))
+        heightmap = island.finalize(heightmap, width, height)
+        self.assertTrue(numpy.array_equal(
+            heightmap, island.generate(self.PARAMETERS, width, height, 7)))
@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import unittest
+
+import numpy
+from src.raw.cliffs import Cliffs
+from src.raw.hydrology import Hydrology
+
+
+class Test_Hydrology(unittest.TestCase):
+    def hydrology(self, heightmap: object, cliffmap: object = None, sea_level: float = 0.0) -> Hydrology:
+        width, height = heightmap.shape
+        if cliffmap is None:
+            cliffmap = numpy.zeros((width, height), numpy.uint8)
+        hydrology = Hydrology(heightmap, cliffmap, width, height, sea_level)
+        hydrology.calculate_directions()
+        return hydrology
+
+    def test_directions(self):
+        # A slope to the sea at x = 0, the middle column is a valley
+        heightmap = numpy.tile(0.1 * numpy.arange(5)[:, numpy.newaxis], (1, 3))
+        heightmap[:, [0, 2]] += 0.5
+        hydrology = self.hydrology(heightmap)
+        receivers = hydrology.receivers.reshape(5, 3)
+
+        # The valley flows to the sea, the sides flow to the valley
+        self.assertEqual(receivers[3, 1], 2 * 3 + 1)
+        self.assertEqual(receivers[3, 0], 3 * 3 + 1)
+        self.assertEqual(receivers[0, 1], -1)
+
+    def test_accumulation(self):
+        heightmap = numpy.tile(0.1 * numpy.arange(5)[:, numpy.newaxis], (1, 3))
+        heightmap[:, [0, 2]] += 0.5
+        hydrology = self.hydrology(heightmap)
+        accumulation = hydrology.accumulation()
+
+        self.assertTrue(numpy.array_equal(accumulation[:, 0], numpy.ones(5)))
+        self.assertTrue(numpy.array_equal(accumulation[:, 1], [15, 12, 9, 6, 3]))
+
+    def test_accumulation_cycles(self):
+        heightmap = numpy.tile(0.1 * numpy.arange(5)[:, numpy.newaxis], (1, 3))
+        heightmap[:, [0, 2]] += 0.5
+        hydrology = self.hydrology(heightmap)
+        # The valley cells 2 and 3 flow into each other, the cell 4 of the side flows into itself
+        receivers = hydrology.receivers.copy()
+        receivers[2 * 3 + 1] = 3 * 3 + 1
+        receivers[4 * 3 + 2] = 4 * 3 + 2
+        with self.assertLogs(level='WARNING'):
+            accumulation = hydrology.accumulate(numpy.ones(15), receivers)
+        # The lowest cell of each cycle is a sink, no weight is lost
+        self.assertTrue(numpy.array_equal(accumulation[:, 1], [6, 3, 8, 5, 2]))
+        self.assertEqual(accumulation[0, 1] + accumulation[2, 1] + accumulation[4, 2], 15)
+        # The given receivers aren't modified
+        self.assertEqual(receivers[2 * 3 + 1], 3 * 3 + 1)
+
+    def test_cliffs(self):
+        # A slope to the south (y + 1), a cliff line on y = 1
+        heightmap = numpy.tile(numpy.arange(4, 0, -1, dtype=numpy.float64), (3, 1))
+        cliffmap = numpy.zeros((3, 4), numpy.uint8)
+        cliffmap[:, 1] = Cliffs.EAST_MASK
+        cliffmap[1, 1] = Cliffs.SOUTH_MASK
+        hydrology = self.hydrology(heightmap, cliffmap)
+        receivers = hydrology.receivers.reshape(3, 4)
+
+        # The water flows to the vertical cliff and crosses it
+        self.assertEqual(receivers[1, 0], 1 * 4 + 1)
+        self.assertEqual(receivers[1, 1], 1 * 4 + 2)
+        # The other cliffs are walls
+        self.assertEqual(receivers[0, 0], -1)
+        self.assertEqual(receivers[0, 1], -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
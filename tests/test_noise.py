@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import unittest
+
+import numpy
+from src.raw.hm_generation.noise import Noise
+
+
+class Test_Noise(unittest.TestCase):
+    # Values of opensimplex.OpenSimplex(1993).noise2d
+    REFERENCE = [
+        ((0, 0), 0.0),
+        ((0.5, 0.25), 0.47021806816897105),
+        ((-12.3, 45.6), 0.007695472479597629),
+        ((999.9, -3.2), 0.5169572489017181)]
+
+    def test_noise2d(self):
+        noise = Noise(1993)
+        xs = numpy.array([p[0] for p, _v in self.REFERENCE])
+        ys = numpy.array([p[1] for p, _v in self.REFERENCE])
+        values = noise.noise2d(xs, ys)
+        for value, (_p, expected) in zip(values, self.REFERENCE):
+            self.assertEqual(value, expected)
+
+    def test_shape(self):
+        noise = Noise(1)
+        xs, ys = numpy.indices((7, 9)) / 3.0
+        values = noise.noise2d(xs, ys)
+        self.assertEqual(values.shape, (7, 9))
+        self.assertTrue(numpy.all(numpy.abs(values) <= 1))
+        self.assertEqual(values[2, 5], noise.noise2d(xs[2:3, 5], ys[2:3, 5])[0])
+
+    def test_fbm(self):
+        noise = Noise(42, octaves=4, persistence=0.5, lacunarity=2, initial_scale=3)
+        self.assertEqual(noise.octaves, 4)
+        self.assertEqual(noise.weights, [1.0, 0.5, 0.25, 0.125])
+        self.assertEqual(noise.offsets, Noise.octave_offsets(42, 4))
+        xs, ys = numpy.indices((20, 10))
+        values = noise.fbm(xs, ys, 20.0)
+        self.assertTrue(numpy.all(values >= 0))
+        self.assertTrue(numpy.all(values <= 2 * sum(noise.weights)))
+        # Reproducible for a given seed
+        other = Noise(42, octaves=4, persistence=0.5, lacunarity=2, initial_scale=3)
+        self.assertTrue(numpy.array_equal(values, other.fbm(xs, ys, 20.0)))
+
+    def test_quantized_fbm(self):
+        noise = Noise(3, octaves=5, persistence=0.5, lacunarity=2, initial_scale=7)
+        xs, ys = numpy.indices((60, 60))
+        xs, ys = xs.ravel(), ys.ravel()
+        coefs = 1 - numpy.hypot(xs - 30, ys - 30) / 43
+        levels = 5
+        expected = noise.fbm(xs, ys, 60.0) * coefs
+        values, saved = noise.quantized_fbm(xs, ys, 60.0, levels, coefs)
+        values *= coefs
+        self.assertGreater(saved, 0)
+        # The stratums are the same
+        for heights in (expected, values):
+            heights -= numpy.amin(heights)
+            heights /= numpy.amax(heights)
+        step = 1 / levels
+        self.assertTrue(numpy.array_equal(
+            expected - expected % step, values - values % step))
@@ -4,7 +4,7 @@
 import unittest
 
 import numpy
-from src.helpers.resize import resize_data
+from src.helpers.resize import reduce_data, resize_data, upscale_view
 
 
 class Test_Resize(unittest.TestCase):
@@ -21,4 +21,30 @@ class Test_Resize(unittest.TestCase):
         self.assertEqual(arr[0, 0], arr_resized[0, 0])
         self.assertEqual(arr[0, 0], arr_resized[1, 0])
         self.assertEqual(arr[0, 0], arr_resized[1, 1])
-        self.assertEqual(arr[0, 0], arr_resized[0, 1])
\ No newline at end of file
+        self.assertEqual(arr[0, 0], arr_resized[0, 1])
+
+    def test_reduce_2D(self):
+        arr = numpy.arange(10 * 21, dtype=numpy.float64).reshape(10, 21)
+
+        arr_reduced, w, h = reduce_data(arr, 10, 21, 2)
+        self.assertEqual(w, 5)
+        self.assertEqual(h, 10)
+        self.assertEqual(arr_reduced.shape, (5, 10))
+
+        self.assertEqual(arr_reduced[0, 0], numpy.mean(arr[0:2, 0:2]))
+        self.assertEqual(arr_reduced[4, 9], numpy.mean(arr[8:10, 18:20]))
+
+    def test_resize_dtype_factor(self):
+        arr = numpy.arange(7 * 5, dtype=numpy.uint8).reshape(7, 5)
+        for factor in (1, 2, 3):
+            arr_resized, w, h = resize_data(arr, 7, 5, factor)
+            self.assertEqual(arr_resized.dtype, numpy.uint8)
+            self.assertTrue(numpy.array_equal(arr_resized, numpy.kron(arr, numpy.ones((factor, factor), numpy.uint8))))
+
+    def test_upscale_view(self):
+        arr = numpy.arange(4 * 6, dtype=numpy.float64).reshape(4, 6)
+        view = upscale_view(arr, 3)
+        self.assertEqual(view.shape, (4, 3, 6, 3))
+        self.assertTrue(numpy.shares_memory(view, arr))
+        self.assertTrue(numpy.array_equal(view.reshape(12, 18), resize_data(arr, 4, 6, 3)[0]))
+
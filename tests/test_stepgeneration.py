@@ -3,6 +3,7 @@
 
 import unittest
 import os
+import pickle
 
 from src.generation_step_manager import GenerationStepManager
 
@@ -21,6 +22,15 @@ class Foo():
         return Foo(arr[0])
 
 
+class Bar(Foo):
+    def clone(self):
+        return Bar(self.message)
+
+    @staticmethod
+    def from_array(arr):
+        return Bar(arr[0])
+
+
 class Test_GenerationStepManager(unittest.TestCase):
     def test_general_logic(self):
         # Initialize
@@ -80,4 +90,35 @@ class Test_GenerationStepManager(unittest.TestCase):
             data.message = "".join([data.message, ",NEW_STEP_3"])
             return data
         do_something()
-        self.assertEqual(data.message, "STEP_0,STEP_1,NEW_STEP_3")
\ No newline at end of file
+        self.assertEqual(data.message, "STEP_0,STEP_1,NEW_STEP_3")
+
+    def test_version(self):
+        path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tests", "outputs")
+        os.makedirs(path, exist_ok=True)
+        path_to_file = os.path.join(path, "step_version.bin")
+        fg = GenerationStepManager(True, path_to_file, -1, Bar, (('a', 1), ('b', 2)))
+        data = fg.init_data("STEP_0")
+
+        @fg.make_step(1)
+        def step_1():
+            data.message += ",STEP_1"
+            return data
+        step_1()
+        fg.save()
+        # Same version, the step is loaded
+        fg = GenerationStepManager(True, path_to_file, 1, Bar, (('a', 1), ('b', 2)))
+        fg.load()
+        self.assertEqual(fg.init_data("DUMMY").message, "STEP_0,STEP_1")
+        # Another version, the steps are ignored
+        fg = GenerationStepManager(True, path_to_file, 1, Bar, (('a', 1), ('c', 2), ('b', 3)))
+        with self.assertLogs(level='WARNING'):
+            fg.load()
+        self.assertEqual(fg.init_data("DUMMY").message, "DUMMY")
+        # A file without version, saved before the versions, is ignored too
+        with open(path_to_file, 'wb') as file:
+            pickle.dump({1: ["STEP_0,STEP_1"]}, file)
+        fg = GenerationStepManager(True, path_to_file, 1, Bar)
+        with self.assertLogs(level='WARNING'):
+            fg.load()
+        self.assertEqual(fg.init_data("DUMMY").message, "DUMMY")
+        os.remove(path_to_file)
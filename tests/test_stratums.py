@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import unittest
+from types import SimpleNamespace
+
+import numpy
+from src.helpers.shift import shifted_slices
+from src.raw.rawmap import RawMap
+from src.raw.stratums import Stratums
+
+
+class Test_Stratums(unittest.TestCase):
+    @staticmethod
+    def reference_broken_lines(stratums: object, step: float, step_count: int):
+        # Per cell implementation of the broken lines correction
+        width, height = stratums.shape
+        highest = numpy.amax(stratums)
+        filter_range = 0.1 * step
+        for i in range(step_count + 1):
+            filter_height = highest - step * i
+            for x in range(width):
+                for y in range(height):
+                    current = stratums[x, y]
+                    if filter_height - filter_range < current < filter_height + filter_range:
+                        for dir_x, dir_y in Stratums.DIRS_OFFSETS:
+                            nx, ny = x + dir_x, y + dir_y
+                            if 0 <= nx < width and 0 <= ny < height:
+                                if current - stratums[nx, ny] > step:
+                                    stratums[nx, ny] = current - step
+
+    @staticmethod
+    def reference_orphan_pixels(levels: object):
+        # Per cell implementation of the orphan pixels correction on the levels, in the scan order
+        width, height = levels.shape
+        for x in range(width):
+            for y in range(height):
+                neighbours = [(x + dx, y + dy) for dx, dy in Stratums.DIRS_4_OFFSETS
+                              if 0 <= x + dx < width and 0 <= y + dy < height]
+                if all(levels[neighbour] != levels[x, y] for neighbour in neighbours):
+                    value = 0
+                    for neighbour in neighbours:
+                        value += levels[neighbour]
+                    levels[x, y] = value // 4
+
+    def test_broken_lines(self):
+        rng = numpy.random.default_rng(1993)
+        for heightmap in (rng.random((30, 41)), numpy.cumsum(rng.random((40, 40)) - 0.3, axis=0)):
+            width, height = heightmap.shape
+            step_count = 7
+            step = (numpy.amax(heightmap) - numpy.amin(heightmap)) / float(step_count)
+            stratums_gen = Stratums(SimpleNamespace(step_count=step_count), heightmap, width, height)
+            # Quantization
+            stratums = numpy.zeros(heightmap.shape)
+            stratums_gen._base_calculation(heightmap, stratums, step)
+            expected = numpy.array([[value - value % step for value in row] for row in heightmap.tolist()])
+            self.assertTrue(numpy.array_equal(stratums, expected))
+            # Broken lines, identical to the per cell implementation
+            self.reference_broken_lines(expected, step, step_count)
+            stratums_gen._correct_broken_lines(stratums, step, step_count)
+            self.assertTrue(numpy.array_equal(stratums, expected))
+            # No cliff is higher than a step anymore
+            for dir_x, dir_y in Stratums.DIRS_OFFSETS:
+                cells, neighbours = shifted_slices(dir_x, dir_y, width, height)
+                self.assertTrue(numpy.all(stratums[cells] - stratums[neighbours] <= step * (1 + 1e-9)))
+
+
+    def test_orphan_pixels(self):
+        rng = numpy.random.default_rng(1993)
+        levels = rng.integers(0, 3, (37, 29))
+        # Scan mode, identical to the per cell implementation
+        expected = levels.copy()
+        self.reference_orphan_pixels(expected)
+        result = levels.copy()
+        Stratums(SimpleNamespace(), None, 37, 29)._correct_orphan_pixels(result)
+        self.assertTrue(numpy.array_equal(result, expected))
+        # Deterministic mode, independent of the scan order
+        parameters = SimpleNamespace(orphans_mode="deterministic")
+        result = levels.copy()
+        Stratums(parameters, None, 37, 29)._correct_orphan_pixels(result)
+        transposed = numpy.ascontiguousarray(levels.T)
+        Stratums(parameters, None, 29, 37)._correct_orphan_pixels(transposed)
+        self.assertTrue(numpy.array_equal(result, transposed.T))
+        self.assertRaises(ValueError, Stratums(SimpleNamespace(orphans_mode="unknown"), None, 37, 29)
+                          ._correct_orphan_pixels, levels.copy())
+
+
+    def test_levels(self):
+        rng = numpy.random.default_rng(1993)
+        heightmap = numpy.cumsum(rng.random((40, 30)) - 0.3, axis=0)
+        stratums_gen = Stratums(SimpleNamespace(step_count=10), heightmap, 40, 30)
+        stratums_gen.calculate_stratums()
+        self.assertEqual(stratums_gen.stratums.dtype, numpy.uint8)
+        self.assertAlmostEqual(stratums_gen.step, (numpy.amax(heightmap) - numpy.amin(heightmap)) / 10)
+        # The levels and the metadata give back the heights of the stratums
+        rawmap = RawMap(80, 60)
+        rawmap.stratums = stratums_gen.stratums
+        rawmap.stratums_step = stratums_gen.step
+        rawmap.stratums_base = stratums_gen.base
+        heights = RawMap.from_array(rawmap.clone().to_array()).stratums_heights()
+        expected = numpy.zeros(heightmap.shape)
+        stratums_gen._base_calculation(heightmap, expected, stratums_gen.step)
+        stratums_gen._correct_broken_lines(expected, stratums_gen.step, 10)
+        levels = numpy.rint(expected / stratums_gen.step).astype(numpy.int64)
+        stratums_gen._correct_orphan_pixels(levels)
+        self.assertTrue(numpy.allclose(heights, levels * stratums_gen.step))
+        # Flatland
+        stratums_gen = Stratums(SimpleNamespace(step_count=10), numpy.ones((5, 5)), 5, 5)
+        stratums_gen.calculate_stratums()
+        self.assertFalse(numpy.any(stratums_gen.stratums))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import math
+import unittest
+from types import SimpleNamespace
+
+import numpy
+from src.raw.thermal_erosion import ThermalErosion
+
+
+class Test_ThermalErosion(unittest.TestCase):
+    PARAMETERS = {"iterations": 20, "talus": 0.02, "rate": 0.25}
+
+    def erode(self, heightmap: object, **parameters) -> object:
+        width, height = heightmap.shape
+        thermal = ThermalErosion(SimpleNamespace(**{**self.PARAMETERS, **parameters}),
+                                 heightmap, width, height)
+        thermal.erode()
+        return thermal.heightmap
+
+    @staticmethod
+    def reference(heightmap: object, iterations: int, talus: float, rate: float) -> object:
+        # Naive cell by cell implementation
+        width, height = heightmap.shape
+        for _iteration in range(iterations):
+            delta = numpy.zeros_like(heightmap)
+            for x in range(width):
+                for y in range(height):
+                    excess = {}
+                    for dx, dy in ThermalErosion.DIRS_OFFSETS:
+                        nx, ny = x + dx, y + dy
+                        if 0 <= nx < width and 0 <= ny < height:
+                            diff = heightmap[x, y] - heightmap[nx, ny] - talus * math.hypot(dx, dy)
+                            if diff > 0:
+                                excess[(nx, ny)] = diff
+                    if excess:
+                        total = sum(excess.values())
+                        moved = rate * max(excess.values())
+                        for cell, diff in excess.items():
+                            delta[cell] += moved * diff / total
+                        delta[x, y] -= moved
+            heightmap = heightmap + delta
+        return heightmap
+
+    def test_reference(self):
+        # A single block and several blocks of rows
+        for shape in ((17, 23), (ThermalErosion.BLOCK_ROWS * 2 + 5, 7)):
+            heightmap = numpy.random.default_rng(1993).random(shape)
+            expected = self.reference(heightmap.copy(), **self.PARAMETERS)
+            result = self.erode(heightmap)
+            self.assertTrue(numpy.allclose(result, expected))
+
+    def test_conservation(self):
+        heightmap = numpy.zeros((80, 32))
+        heightmap[ThermalErosion.BLOCK_ROWS, 16] = 1
+        result = self.erode(heightmap.copy(), iterations=100)
+        # No material leaves the map and the peak is flattened
+        self.assertAlmostEqual(result.sum(), 1.0)
+        self.assertLess(result.max(), 0.5)
+
+    def test_stable(self):
+        # Slopes under the talus don't move
+        heightmap = numpy.tile(numpy.arange(16) * 0.01, (16, 1))
+        result = self.erode(heightmap.copy())
+        self.assertTrue(numpy.array_equal(result, heightmap))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import unittest
+
+from src.helpers.tiles import split_tiles
+
+
+class Test_Tiles(unittest.TestCase):
+    def test_split_tiles(self):
+        tiles = split_tiles(10, 7, 4)
+        self.assertEqual(len(tiles), 3 * 2)
+        self.assertEqual(tiles[0], (0, 4, 0, 4))
+        self.assertEqual(tiles[-1], (8, 10, 4, 7))
+        # Each cell is in exactly one tile
+        surface = sum((x_end - x_start) * (y_end - y_start)
+                      for x_start, x_end, y_start, y_end in tiles)
+        self.assertEqual(surface, 10 * 7)
@@ -0,0 +1,154 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+import unittest
+from types import SimpleNamespace
+
+import numpy
+from src.raw.cliffs import Cliffs
+from src.raw.rawmap import RawMap
+from src.raw.waters import Waters
+
+
+class Test_Waters(unittest.TestCase):
+    PARAMETERS = {
+        "sea_level": 0.05,
+        "river_lifetime": 100,
+        "pooling": {"max_depth": 0.04, "basin_trim": 0.05},
+        "sources": {"amount": 1, "distance": 10, "power_range": [0.6, 1.2], "x_range": [0.1, 0.9],
+                    "y_range": [0.1, 0.9], "height_range": [0.4, 1]}
+    }
+
+    def waters(self, heightmap: object, **pooling) -> Waters:
+        width, height = heightmap.shape
+        rawmap = RawMap(width, height)
+        rawmap.heightmap = heightmap
+        rawmap.stratums = numpy.zeros((width, height), numpy.uint8)
+        rawmap.cliffs = numpy.zeros((width, height), numpy.uint8)
+        parameters = SimpleNamespace(**self.PARAMETERS)
+        parameters.pooling = SimpleNamespace(**{**parameters.pooling, **pooling})
+        parameters.sources = SimpleNamespace(**parameters.sources)
+        return Waters(parameters, rawmap, width, height, 1993)
+
+    def test_layer_size_deprecated(self):
+        heightmap = numpy.tile(numpy.linspace(0.0, 1.0, 8)[:, numpy.newaxis], (1, 5))
+        with self.assertLogs(level='WARNING') as logs:
+            self.waters(heightmap, layer_size=0.01)
+        self.assertTrue(any("layer_size" in line for line in logs.output))
+
+    def test_find_river(self):
+        # A valley along y = 2 that flows to the sea at x = 0
+        heightmap = numpy.tile(numpy.linspace(0.0, 1.0, 8)[:, numpy.newaxis], (1, 5))
+        heightmap[:, [0, 1, 3, 4]] += 0.5
+        waters = self.waters(heightmap)
+        drainsmap = numpy.full(heightmap.shape, -1, numpy.int32)
+
+        river = waters._find_river(6, 2, drainsmap)
+        self.assertEqual(river, [(6, 2), (5, 2), (4, 2), (3, 2), (2, 2), (1, 2), (0, 2)])
+        # The search arrays are reused by the next searches
+        self.assertEqual(waters._find_river(6, 2, drainsmap), river)
+        self.assertEqual(waters._find_river(3, 2, drainsmap), river[3:])
+
+    def test_find_river_drain(self):
+        # The river jumps to the drain of a pool and continues from there
+        heightmap = numpy.tile(numpy.linspace(0.0, 1.0, 8)[:, numpy.newaxis], (1, 5))
+        heightmap[:, [0, 1, 3, 4]] += 0.5
+        waters = self.waters(heightmap)
+        drainsmap = numpy.full(heightmap.shape, -1, numpy.int32)
+        drainsmap[5, 2] = 2 * 5 + 2
+
+        river = waters._find_river(6, 2, drainsmap)
+        self.assertEqual(river, [(6, 2), (2, 2), (1, 2), (0, 2)])
+
+    def test_find_sources(self):
+        heightmap = numpy.tile(numpy.linspace(0.0, 1.0, 60)[:, numpy.newaxis], (1, 50))
+        waters = self.waters(heightmap)
+        waters._rawmap.cliffs[30:40, :] = Cliffs.NORTH_MASK
+        waters._sources_amount = 1000
+        waters._sources_distance = 4
+
+        sources, powers = waters._find_sources()
+        self.assertEqual(len(sources), len(powers))
+        self.assertGreater(len(sources), 20)
+        self.assertLess(len(sources), 1000)  # The valid cells are all used
+        for x, y in sources:
+            self.assertTrue(6 <= x <= 54 and 5 <= y <= 45)
+            self.assertGreaterEqual(heightmap[x, y], 0.4)
+            self.assertEqual(waters._rawmap.cliffs[x, y], 0)
+        points = numpy.array(sources)
+        distances = numpy.square(points[:, numpy.newaxis] - points[numpy.newaxis]).sum(axis=2)
+        numpy.fill_diagonal(distances, 16)
+        self.assertGreaterEqual(distances.min(), 16)
+        self.assertTrue(all(0.6 <= power <= 1.2 for power in powers))
+        # Same seed, same sources
+        self.assertEqual(self.waters(heightmap)._find_sources(), self.waters(heightmap)._find_sources())
+
+
+    @staticmethod
+    def valley(profile: list) -> object:
+        # A valley along y = 1 between two walls
+        heightmap = numpy.ones((len(profile), 3))
+        heightmap[:, 1] = profile
+        return heightmap
+
+    def test_flood(self):
+        # Two basins that spill into the sea at x = 0
+        waters = self.waters(self.valley([0.0, 0.5, 0.3, 0.6, 0.2, 0.45, 1.0]), max_depth=0.5)
+        waters._find_basins()
+        poolmap = numpy.zeros((7, 3))
+        drainsmap = numpy.full((7, 3), -1, numpy.int32)
+
+        poolmap, drainsmap, too_deep = waters._flood(4, 1, poolmap, drainsmap)
+        self.assertFalse(too_deep)
+        self.assertTrue(numpy.allclose(poolmap[:, 1], [0, 0, 0, 0, 0.4, 0.15, 0]))
+        self.assertEqual(drainsmap[4, 1], 2 * 3 + 1)
+        self.assertEqual(drainsmap[5, 1], 2 * 3 + 1)
+
+        poolmap, drainsmap, too_deep = waters._flood(2, 1, poolmap, drainsmap)
+        self.assertFalse(too_deep)
+        self.assertAlmostEqual(poolmap[2, 1], 0.2)
+        self.assertEqual(drainsmap[2, 1], 0 * 3 + 1)
+
+    def test_flood_merged(self):
+        # The basins merge before they spill into the sea
+        waters = self.waters(self.valley([0.0, 0.7, 0.3, 0.5, 0.2, 0.45, 1.0]), max_depth=0.6)
+        waters._find_basins()
+        poolmap = numpy.zeros((7, 3))
+        drainsmap = numpy.full((7, 3), -1, numpy.int32)
+
+        poolmap, drainsmap, too_deep = waters._flood(4, 1, poolmap, drainsmap)
+        self.assertFalse(too_deep)
+        self.assertEqual(drainsmap[4, 1], 2 * 3 + 1)
+        # Both basins full : they are filled together up to the sea
+        poolmap, drainsmap, too_deep = waters._flood(2, 1, poolmap, drainsmap)
+        self.assertFalse(too_deep)
+        self.assertTrue(numpy.allclose(poolmap[:, 1], [0, 0, 0.4, 0.2, 0.5, 0.25, 0]))
+        self.assertEqual(drainsmap[4, 1], 0 * 3 + 1)
+
+    def test_flood_too_deep(self):
+        waters = self.waters(self.valley([0.0, 0.5, 0.3, 0.6, 0.2, 0.45, 1.0]), max_depth=0.3)
+        waters._find_basins()
+        poolmap = numpy.zeros((7, 3))
+        drainsmap = numpy.full((7, 3), -1, numpy.int32)
+
+        poolmap, drainsmap, too_deep = waters._flood(4, 1, poolmap, drainsmap)
+        self.assertTrue(too_deep)
+        self.assertTrue(numpy.allclose(poolmap[:, 1], [0, 0, 0, 0, 0.3, 0.05, 0]))
+        self.assertEqual(drainsmap[4, 1], -1)
+
+
+    def test_flow_rivers(self):
+        # The river fills both basins on its way to the sea
+        waters = self.waters(self.valley([0.0, 0.5, 0.3, 0.6, 0.2, 0.45, 1.0]), max_depth=0.5, basin_trim=0)
+        waters._find_basins()
+        rivermap, poolmap = numpy.zeros((7, 3)), numpy.zeros((7, 3))
+        drainsmap = numpy.full((7, 3), -1, numpy.int32)
+
+        rivermap, poolmap, drainsmap = waters._flow_rivers([(5, 1)], [0.8], rivermap, poolmap, drainsmap)
+        self.assertTrue(numpy.allclose(rivermap[:, 1], [0.8, 0, 0.8, 0, 0, 0.8, 0]))
+        self.assertTrue(numpy.array_equal(poolmap[:, 1] > 0, [False, False, True, False, True, True, False]))
+        self.assertEqual(rivermap[:, [0, 2]].sum(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()